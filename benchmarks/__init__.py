@@ -0,0 +1,6 @@
+"""
+Benchmarks for the review pipeline.
+
+Run from the repository root, e.g. ``python -m benchmarks.webhook_parsing``.
+They use synthetic inputs and never call GitHub or the LLM.
+"""
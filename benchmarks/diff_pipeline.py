@@ -0,0 +1,217 @@
+"""
+CPU and memory cost of the diff stages of a review: ``PatchSet`` parsing,
+rendering the LLM input, building the comment position index, anchoring
+findings and planning review chunks, on synthetic diffs of 10 to 100k
+lines.
+
+    python -m benchmarks.diff_pipeline [--sizes 10,1000,10000,100000]
+    python -m benchmarks.diff_pipeline --compare <commit or results file>
+
+Results are saved to benchmarks/results/<commit>.json so a change can be
+compared against the run of an earlier commit.
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testergpt.settings")
+django.setup()
+
+from unidiff import PatchSet  # noqa: E402
+
+from benchmarks.diffgen import generate_diff  # noqa: E402
+from core.chunking import plan_chunks, reviewable_hunks  # noqa: E402
+from github.diff import render_diff  # noqa: E402
+from github.positions import AmbiguousPathError, DiffPositionIndex  # noqa: E402
+from testergpt.settings import settings  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_SIZES = "10,1000,10000,100000"
+
+
+def diff_for(lines: int) -> str:
+    """Files, renames, binaries and long lines scale with the diff"""
+    files = min(max(1, lines // 100), 500)
+    return generate_diff(
+        lines=lines,
+        files=files,
+        renames=files // 10,
+        binaries=files // 20,
+        long_lines=files // 5,
+    )
+
+
+def findings_for(index: DiffPositionIndex) -> list:
+    """Findings as the model reports them: full, short and suffix paths, lines and ranges"""
+    findings = []
+    for path, lines in index.lines.items():
+        numbers = sorted(lines)
+        if not numbers:
+            continue
+        middle = numbers[len(numbers) // 2]
+        findings.append((path, str(numbers[0])))
+        findings.append((path.rsplit("/", 1)[-1], str(middle)))
+        findings.append((f"repo/{path}", f"{numbers[0]}-{numbers[-1]}"))
+        findings.append((path, str(numbers[-1] + 1000)))
+    return findings
+
+
+def anchor_all(index: DiffPositionIndex, findings: list) -> int:
+    anchored = 0
+    for path, line in findings:
+        try:
+            anchored += index.anchor(path, line) is not None
+        except AmbiguousPathError:
+            pass
+    return anchored
+
+
+def stages(raw: str):
+    """(name, callable) pairs; each stage gets the inputs it sees in production"""
+    patch = PatchSet(raw)
+    index = DiffPositionIndex.from_patch(patch)
+    findings = findings_for(index)
+    files = reviewable_hunks(patch)
+    return [
+        ("parse", lambda: PatchSet(raw)),
+        ("render", lambda: render_diff(patch)),
+        ("position_index", lambda: DiffPositionIndex.from_patch(patch)),
+        ("anchor", lambda: anchor_all(index, findings)),
+        ("plan_chunks", lambda: plan_chunks(files, settings.LLM_CHUNK_TOKEN_BUDGET)),
+    ]
+
+
+def measure(fn, repeat: int) -> dict:
+    fn()  # warm up
+    timings = []
+    # Like timeit, keep collector pauses out of the timings
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "min_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "peak_alloc_bytes": peak,
+    }
+
+
+def run(sizes, repeat: int) -> dict:
+    results = {}
+    for lines in sizes:
+        raw = diff_for(lines)
+        # Large diffs are slow enough that a few runs are representative
+        runs = max(1, repeat if lines < 10000 else repeat // 5)
+        results[str(lines)] = {
+            "diff_bytes": len(raw.encode("utf-8")),
+            "stages": {name: measure(fn, runs) for name, fn in stages(raw)},
+        }
+    return results
+
+
+def git_revision() -> str:
+    """Short HEAD, suffixed with -dirty when the tree has uncommitted changes"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{revision}-dirty" if dirty else revision
+
+
+def load_baseline(ref: str) -> dict:
+    path = Path(ref)
+    if not path.exists():
+        path = RESULTS_DIR / f"{ref}.json"
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def report(results: dict, baseline: dict = None) -> None:
+    for lines, result in results.items():
+        print(f"\n{lines} lines ({result['diff_bytes'] / 1024:.1f} KiB)")
+        for name, stage in result["stages"].items():
+            line = (
+                f"  {name:<16} {stage['median_ms']:>10.3f} ms median "
+                f"{stage['min_ms']:>10.3f} ms min "
+                f"{stage['peak_alloc_bytes'] / 1024:>10.1f} KiB peak"
+            )
+            before = (
+                (baseline or {})
+                .get("results", {})
+                .get(lines, {})
+                .get("stages", {})
+                .get(name)
+            )
+            if before and before["median_ms"]:
+                line += f"   x{stage['median_ms'] / before['median_ms']:.2f} time"
+                if before["peak_alloc_bytes"]:
+                    ratio = stage["peak_alloc_bytes"] / before["peak_alloc_bytes"]
+                    line += f" x{ratio:.2f} memory"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", default=DEFAULT_SIZES, help="Comma separated diff line counts"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--compare", help="Commit or results file to compare against")
+    parser.add_argument(
+        "--no-save", action="store_true", help="Do not write benchmarks/results"
+    )
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    revision = git_revision()
+    print(f"Diff pipeline benchmark at {revision}, sizes {sizes}")
+    results = run(sizes, args.repeat)
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    if baseline:
+        print(f"Comparing against {baseline['revision']}")
+    report(results, baseline)
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        path = RESULTS_DIR / f"{revision}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"revision": revision, "created_at": time.time(), "results": results},
+                f,
+                indent=2,
+            )
+        print(f"\nSaved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Synthetic unified diffs in the git format GitHub serves.
+
+``generate_diff`` spreads a target number of diff lines over modified and
+new files. It can add renames, binary files and minified-style long lines.
+Output is deterministic for a given seed.
+"""
+
+import random
+from typing import List
+
+CONTEXT_LINES = 3
+
+
+def generate_diff(
+    lines: int = 1000,
+    files: int = 10,
+    renames: int = 0,
+    binaries: int = 0,
+    long_lines: int = 0,
+    long_line_length: int = 4000,
+    hunk_lines: int = 20,
+    seed: int = 0,
+) -> str:
+    """
+    A diff with about ``lines`` hunk lines over ``files`` text files. Every
+    fifth file is new; the first ``renames`` modified files are renamed, and
+    ``binaries`` binary files are appended. The first ``long_lines`` added
+    lines are ``long_line_length`` characters long.
+    """
+    rng = random.Random(seed)
+    files = max(1, files)
+    per_file = max(1, lines // files)
+    long_left = long_lines
+    renamed = 0
+    parts: List[str] = []
+
+    def added_line(name: str, number: int) -> str:
+        nonlocal long_left
+        if long_left > 0:
+            long_left -= 1
+            chunk = f"{name}_{number}=[{rng.random():.6f}];"
+            return (
+                "+" + (chunk * (long_line_length // len(chunk) + 1))[:long_line_length]
+            )
+        return f"+    {name}_{number} = compute({number}, {rng.randint(0, 9999)})"
+
+    for index in range(files):
+        # Shared basenames in different directories exercise path resolution
+        name = f"module_{index}" if index % 4 else "utils"
+        path = f"pkg{index % 7}/sub{index}/{name}.py"
+        if index % 5 == 4:
+            body = [added_line(name, number) for number in range(1, per_file + 1)]
+            parts.append(
+                f"diff --git a/{path} b/{path}\n"
+                "new file mode 100644\n"
+                f"index 0000000..{rng.getrandbits(28):07x}\n"
+                "--- /dev/null\n"
+                f"+++ b/{path}\n"
+                f"@@ -0,0 +1,{per_file} @@\n" + "\n".join(body) + "\n"
+            )
+            continue
+
+        source_path = path
+        header = f"index {rng.getrandbits(28):07x}..{rng.getrandbits(28):07x} 100644\n"
+        if renamed < renames:
+            renamed += 1
+            source_path = f"legacy/{path}"
+            header = (
+                "similarity index 90%\n"
+                f"rename from {source_path}\n"
+                f"rename to {path}\n" + header
+            )
+
+        hunks = []
+        source_line = target_line = 1
+        remaining = per_file
+        while remaining > 0:
+            size = min(
+                max(hunk_lines, 2 * CONTEXT_LINES + 2), remaining + 2 * CONTEXT_LINES
+            )
+            changed = max(2, size - 2 * CONTEXT_LINES)
+            removed = rng.randint(0, changed // 2)
+            added = changed - removed
+            # Gap of untouched lines before the hunk
+            gap = rng.randint(5, 40)
+            source_line += gap
+            target_line += gap
+
+            body = [f"     head_{source_line + i} = {i}" for i in range(CONTEXT_LINES)]
+            body += [f"-    old_{source_line + i} = None" for i in range(removed)]
+            body += [added_line(name, target_line + i) for i in range(added)]
+            body += [f"     tail_{source_line + i} = {i}" for i in range(CONTEXT_LINES)]
+            source_length = 2 * CONTEXT_LINES + removed
+            target_length = 2 * CONTEXT_LINES + added
+            hunks.append(
+                f"@@ -{source_line},{source_length} +{target_line},{target_length} @@\n"
+                + "\n".join(body)
+                + "\n"
+            )
+            source_line += source_length
+            target_line += target_length
+            remaining -= len(body)
+
+        parts.append(
+            f"diff --git a/{source_path} b/{path}\n"
+            + header
+            + f"--- a/{source_path}\n"
+            + f"+++ b/{path}\n"
+            + "".join(hunks)
+        )
+
+    for index in range(binaries):
+        path = f"assets/image_{index}.png"
+        parts.append(
+            f"diff --git a/{path} b/{path}\n"
+            "new file mode 100644\n"
+            f"index 0000000..{rng.getrandbits(28):07x}\n"
+            f"Binary files /dev/null and b/{path} differ\n"
+        )
+    return "".join(parts)
@@ -0,0 +1,205 @@
+"""
+Synthetic GitHub webhook deliveries shaped like the real thing.
+
+Every field of the ``github.types`` schemas is filled in, URLs included,
+so payload sizes are in the same range as production deliveries.
+"""
+
+import json
+from typing import Optional
+
+API = "https://api.github.com"
+
+
+def user(login: str = "octocat", type: str = "User") -> dict:
+    url = f"{API}/users/{login}"
+    return {
+        "login": login,
+        "id": 583231,
+        "node_id": "MDQ6VXNlcjU4MzIzMQ==",
+        "avatar_url": "https://avatars.githubusercontent.com/u/583231?v=4",
+        "gravatar_id": "",
+        "url": url,
+        "html_url": f"https://github.com/{login}",
+        "followers_url": f"{url}/followers",
+        "following_url": f"{url}/following{{/other_user}}",
+        "gists_url": f"{url}/gists{{/gist_id}}",
+        "starred_url": f"{url}/starred{{/owner}}{{/repo}}",
+        "subscriptions_url": f"{url}/subscriptions",
+        "organizations_url": f"{url}/orgs",
+        "repos_url": f"{url}/repos",
+        "events_url": f"{url}/events{{/privacy}}",
+        "received_events_url": f"{url}/received_events",
+        "type": type,
+        "user_view_type": "public",
+        "site_admin": False,
+    }
+
+
+def repository(owner: str = "octocat", name: str = "hello-world") -> dict:
+    full_name = f"{owner}/{name}"
+    url = f"{API}/repos/{full_name}"
+    repo = {
+        "id": 1296269,
+        "node_id": "MDEwOlJlcG9zaXRvcnkxMjk2MjY5",
+        "name": name,
+        "full_name": full_name,
+        "private": False,
+        "owner": user(owner),
+        "html_url": f"https://github.com/{full_name}",
+        "description": "This your first repo!",
+        "fork": False,
+        "url": url,
+        "created_at": "2011-01-26T19:01:12Z",
+        "updated_at": "2024-01-26T19:14:43Z",
+        "pushed_at": "2024-01-26T19:06:43Z",
+        "git_url": f"git://github.com/{full_name}.git",
+        "ssh_url": f"git@github.com:{full_name}.git",
+        "clone_url": f"https://github.com/{full_name}.git",
+        "svn_url": f"https://github.com/{full_name}",
+        "homepage": "https://github.com",
+        "size": 108,
+        "stargazers_count": 80,
+        "watchers_count": 80,
+        "language": "Python",
+        "has_issues": True,
+        "has_projects": True,
+        "has_downloads": True,
+        "has_wiki": True,
+        "has_pages": False,
+        "has_discussions": False,
+        "forks_count": 9,
+        "mirror_url": None,
+        "archived": False,
+        "disabled": False,
+        "open_issues_count": 0,
+        "license": {
+            "key": "mit",
+            "name": "MIT License",
+            "spdx_id": "MIT",
+            "url": f"{API}/licenses/mit",
+            "node_id": "MDc6TGljZW5zZW1pdA==",
+        },
+        "allow_forking": True,
+        "is_template": False,
+        "web_commit_signoff_required": False,
+        "topics": ["octocat", "api", "example"],
+        "visibility": "public",
+        "forks": 9,
+        "open_issues": 0,
+        "watchers": 80,
+        "default_branch": "main",
+    }
+    for resource in (
+        "forks", "keys", "collaborators", "teams", "hooks", "issue_events",
+        "events", "assignees", "branches", "tags", "blobs", "git_tags",
+        "git_refs", "trees", "statuses", "languages", "stargazers",
+        "contributors", "subscribers", "subscription", "commits", "git_commits",
+        "comments", "issue_comment", "contents", "compare", "merges", "archive",
+        "downloads", "issues", "pulls", "milestones", "notifications", "labels",
+        "releases", "deployments",
+    ):  # fmt: skip
+        repo[f"{resource}_url"] = f"{url}/{resource.replace('_', '/')}{{/id}}"
+    return repo
+
+
+def pull_request_event(
+    action: str = "opened",
+    number: int = 1347,
+    head_sha: str = "6dcb09b5b57875f334f61aebed695e2e4193db5e",
+    before: Optional[str] = None,
+    installation_id: int = 42,
+    owner: str = "octocat",
+    name: str = "hello-world",
+) -> dict:
+    """A ``pull_request`` delivery as a dict"""
+    repo = repository(owner, name)
+    url = f"{repo['url']}/pulls/{number}"
+    html_url = f"{repo['html_url']}/pull/{number}"
+
+    def branch(ref: str, sha: str) -> dict:
+        return {
+            "label": f"{owner}:{ref}",
+            "ref": ref,
+            "sha": sha,
+            "user": user(owner),
+            "repo": repository(owner, name),
+        }
+
+    links = {
+        "self": {"href": url},
+        "html": {"href": html_url},
+        "issue": {"href": f"{repo['url']}/issues/{number}"},
+        "comments": {"href": f"{repo['url']}/issues/{number}/comments"},
+        "review_comments": {"href": f"{url}/comments"},
+        "review_comment": {"href": f"{repo['url']}/pulls/comments{{/number}}"},
+        "commits": {"href": f"{url}/commits"},
+        "statuses": {"href": f"{repo['url']}/statuses/{head_sha}"},
+    }
+    pull_request = {
+        "url": url,
+        "id": 1,
+        "node_id": "MDExOlB1bGxSZXF1ZXN0MQ==",
+        "html_url": html_url,
+        "diff_url": f"{html_url}.diff",
+        "patch_url": f"{html_url}.patch",
+        "issue_url": f"{repo['url']}/issues/{number}",
+        "number": number,
+        "state": "open",
+        "locked": False,
+        "title": "Amazing new feature",
+        "user": user(owner),
+        "body": "Please pull these awesome changes in!\n" * 20,
+        "created_at": "2024-01-26T19:01:12Z",
+        "updated_at": "2024-01-26T19:01:12Z",
+        "closed_at": None,
+        "merged_at": None,
+        "merge_commit_sha": None,
+        "assignee": user("hubot"),
+        "assignees": [user("hubot"), user("other_user")],
+        "requested_reviewers": [user("reviewer")],
+        "requested_teams": [],
+        "labels": [{"id": 208045946, "name": "bug", "color": "f29513"}],
+        "milestone": None,
+        "draft": False,
+        "commits_url": f"{url}/commits",
+        "review_comments_url": f"{url}/comments",
+        "review_comment_url": f"{repo['url']}/pulls/comments{{/number}}",
+        "comments_url": f"{repo['url']}/issues/{number}/comments",
+        "statuses_url": f"{repo['url']}/statuses/{head_sha}",
+        "head": branch("new-topic", head_sha),
+        "base": branch("main", "9049f1265b7d61be4a8904a9a27120d2064dab3b"),
+        "_links": links,
+        "author_association": "OWNER",
+        "auto_merge": None,
+        "active_lock_reason": None,
+        "merged": False,
+        "mergeable": None,
+        "rebaseable": None,
+        "mergeable_state": "unknown",
+        "merged_by": None,
+        "comments": 0,
+        "review_comments": 0,
+        "maintainer_can_modify": False,
+        "commits": 3,
+        "additions": 100,
+        "deletions": 3,
+        "changed_files": 5,
+    }
+    event = {
+        "action": action,
+        "number": number,
+        "pull_request": pull_request,
+        "repository": repo,
+        "sender": user(owner),
+        "installation": {"id": installation_id, "node_id": "MDIzOkludGVncmF0aW9u"},
+    }
+    if action == "synchronize":
+        event["before"] = before or "0" * 39 + "1"
+        event["after"] = head_sha
+    return event
+
+
+def pull_request_event_body(**kwargs) -> bytes:
+    """A ``pull_request`` delivery encoded the way GitHub sends it"""
+    return json.dumps(pull_request_event(**kwargs)).encode("utf-8")
@@ -0,0 +1,295 @@
+"""
+Local stand-ins for api.github.com and the Gemini REST endpoint.
+
+Both servers answer from memory after a configurable latency, fail a
+configurable share of requests with a 5xx, and count every request by
+route so a benchmark can report external calls per review.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+_PULL = re.compile(r"^/repos/([^/]+)/([^/]+)/pulls/(\d+)$")
+_PULL_COMMENTS = re.compile(r"^/repos/[^/]+/[^/]+/pulls/(\d+)/comments$")
+_PULL_REVIEWS = re.compile(r"^/repos/[^/]+/[^/]+/pulls/(\d+)/reviews$")
+_COMPARE = re.compile(r"^/repos/[^/]+/[^/]+/compare/([^/]+)$")
+_ACCESS_TOKENS = re.compile(r"^/app/installations/(\d+)/access_tokens$")
+_GEMINI = re.compile(
+    r"^/v1beta/models/([^:/]+):(generateContent|streamGenerateContent)$"
+)
+# Review prompts name each file of a chunk on a "File: <path>" line
+_PROMPT_FILE = re.compile(r"^File: (.+)$", re.MULTILINE)
+
+
+def synthetic_diff(seed: str, files: int = 3, lines: int = 40) -> str:
+    """A unified diff adding ``files`` Python files, unique per ``seed``"""
+    parts = []
+    for index in range(files):
+        path = f"src/module_{index}.py"
+        body = "".join(
+            f"+value_{line} = compute({line}, {seed!r})\n"
+            for line in range(1, lines + 1)
+        )
+        parts.append(
+            f"diff --git a/{path} b/{path}\n"
+            "new file mode 100644\n"
+            "index 0000000..1111111\n"
+            "--- /dev/null\n"
+            f"+++ b/{path}\n"
+            f"@@ -0,0 +1,{lines} @@\n{body}"
+        )
+    return "".join(parts)
+
+
+class StubServer:
+    """
+    Threaded HTTP server on 127.0.0.1. ``latency`` is the mean delay in
+    seconds (uniformly jittered by +/-50%), ``error_rate`` the share of
+    requests answered with ``error_status``.
+    """
+
+    error_status = 503
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls: Counter = Counter()
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so client connection pools behave as in production
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def do_POST(self):
+                stub._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name=type(self).__name__, daemon=True
+        ).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        path = urlsplit(handler.path).path
+        route = self.route(handler.command, path)
+        with self._lock:
+            self.calls[route] += 1
+
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            status, headers, payload = self.error_status, {}, b'{"message": "stub"}'
+        else:
+            status, headers, payload = self.respond(
+                handler.command, path, handler.headers, body
+            )
+
+        handler.send_response(status)
+        headers.setdefault("Content-Type", "application/json")
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        try:
+            handler.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. a superseded review cancelled the request
+            handler.close_connection = True
+
+    def route(self, method: str, path: str) -> str:
+        """Label a request is counted under"""
+        return f"{method} {path}"
+
+    def respond(self, method: str, path: str, headers, body: bytes):
+        """Return (status, headers, body bytes)"""
+        return 404, {}, b'{"message": "Not Found"}'
+
+
+class GitHubStub(StubServer):
+    """
+    The endpoints the review pipeline calls: installation tokens, PR and
+    compare diffs, review comments and review creation. Diffs are unique
+    per PR and head so the review cache behaves as it would in production.
+    """
+
+    error_status = 502
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        diff_files: int = 3,
+        diff_lines: int = 40,
+    ):
+        super().__init__(latency, error_rate)
+        self.diff_files = diff_files
+        self.diff_lines = diff_lines
+
+    def route(self, method: str, path: str) -> str:
+        for pattern, name in (
+            (_ACCESS_TOKENS, "access_tokens"),
+            (_PULL, "pull"),
+            (_PULL_COMMENTS, "pull_comments"),
+            (_PULL_REVIEWS, "pull_reviews"),
+            (_COMPARE, "compare"),
+        ):
+            if pattern.match(path):
+                return f"{method} {name}"
+        return f"{method} other"
+
+    def respond(self, method: str, path: str, headers, body: bytes):
+        rate_limit = {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": "4999",
+            "X-RateLimit-Reset": str(int(time.time()) + 3600),
+        }
+        if method == "POST" and _ACCESS_TOKENS.match(path):
+            expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+            token = {
+                "token": "ghs_loadbench",
+                "expires_at": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            return 201, rate_limit, json.dumps(token).encode()
+
+        match = _PULL.match(path) or _COMPARE.match(path)
+        if method == "GET" and match:
+            seed = match.group(match.lastindex)
+            diff = synthetic_diff(seed, self.diff_files, self.diff_lines)
+            return (
+                200,
+                dict(rate_limit, **{"Content-Type": "text/plain; charset=utf-8"}),
+                diff.encode(),
+            )
+        if method == "GET" and _PULL_COMMENTS.match(path):
+            return 200, rate_limit, b"[]"
+        if method == "POST" and _PULL_REVIEWS.match(path):
+            return 200, rate_limit, b'{"id": 1, "state": "COMMENTED"}'
+        return 404, rate_limit, b'{"message": "Not Found"}'
+
+
+class GeminiStub(StubServer):
+    """
+    ``generateContent`` answers with a ``PRReviewResponse`` function call,
+    ``streamGenerateContent`` with JSON Lines text, each reporting
+    ``issues_per_file`` findings on every file named in the prompt.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, error_rate: float = 0.0, issues_per_file: int = 1
+    ):
+        super().__init__(latency, error_rate)
+        self.issues_per_file = issues_per_file
+        self.prompt_chars = 0
+
+    def route(self, method: str, path: str) -> str:
+        match = _GEMINI.match(path)
+        return f"{match.group(1)}:{match.group(2)}" if match else f"{method} other"
+
+    def respond(self, method: str, path: str, headers, body: bytes):
+        match = _GEMINI.match(path)
+        if method != "POST" or match is None:
+            return 404, {}, b'{"error": {"code": 404}}'
+
+        prompt = "".join(
+            part.get("text", "")
+            for content in json.loads(body or b"{}").get("contents", [])
+            for part in content.get("parts", [])
+        )
+        with self._lock:
+            self.prompt_chars += len(prompt)
+        issues = self._issues(prompt)
+        usage = {
+            "promptTokenCount": len(prompt) // 4,
+            "candidatesTokenCount": 50 * len(issues) + 20,
+            "totalTokenCount": len(prompt) // 4 + 50 * len(issues) + 20,
+        }
+
+        if match.group(2) == "streamGenerateContent":
+            lines = [json.dumps(issue) for issue in issues]
+            lines.append(json.dumps({"summary": "Load benchmark review."}))
+            chunks = [
+                {"candidates": [_candidate({"text": line + "\n"})]} for line in lines
+            ]
+            chunks[-1]["usageMetadata"] = usage
+            return 200, {}, json.dumps(chunks).encode()
+
+        call = {
+            "functionCall": {
+                "name": "PRReviewResponse",
+                "args": {"issues": issues, "summary": "Load benchmark review."},
+            }
+        }
+        response = {"candidates": [_candidate(call)], "usageMetadata": usage}
+        return 200, {}, json.dumps(response).encode()
+
+    def _issues(self, prompt: str) -> List[dict]:
+        return [
+            {
+                "type": "warning",
+                "line": str(line),
+                "message": f"Stub finding {line} in {path}",
+                "severity": "low",
+                "file": path,
+            }
+            for path in _PROMPT_FILE.findall(prompt)
+            for line in range(1, self.issues_per_file + 1)
+        ]
+
+
+def _candidate(part: dict) -> dict:
+    return {
+        "content": {"role": "model", "parts": [part]},
+        "finishReason": "STOP",
+        "index": 0,
+    }
+
+
+def start_stubs(
+    github_latency: float = 0.0,
+    github_error_rate: float = 0.0,
+    llm_latency: float = 0.0,
+    llm_error_rate: float = 0.0,
+    **github_options,
+) -> Tuple[GitHubStub, GeminiStub]:
+    """Start both stubs; stop them with ``stop()`` when done"""
+    github = GitHubStub(github_latency, github_error_rate, **github_options).start()
+    gemini = GeminiStub(llm_latency, llm_error_rate).start()
+    return github, gemini
@@ -0,0 +1,76 @@
+"""
+Parse cost of a pull_request delivery: the full ``GithubPRChanged`` schema
+on a DRF-decoded dict, the ``PullRequestEvent`` projection validated
+straight from the raw body, and the fast-reject peek at "action".
+
+    python -m benchmarks.webhook_parsing [--iterations N]
+"""
+
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testergpt.settings")
+django.setup()
+
+from benchmarks.payloads import pull_request_event_body  # noqa: E402
+from github.types import GithubPRChanged, PullRequestEvent  # noqa: E402
+from github.utils import peek_action  # noqa: E402
+
+
+def parse_full(body: bytes):
+    # What the webhook did before: DRF's JSONParser, then the full schema
+    return GithubPRChanged(**json.loads(body))
+
+
+def parse_lean(body: bytes):
+    return PullRequestEvent.model_validate_json(body)
+
+
+def reject(body: bytes):
+    # What an ignored delivery costs in the webhook before the 204
+    return peek_action(body)
+
+
+def measure(parse, body: bytes, iterations: int):
+    parse(body)  # warm up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parse(body)
+    per_call_us = (time.perf_counter() - started) / iterations * 1e6
+
+    tracemalloc.start()
+    parse(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call_us, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    body = pull_request_event_body(action="synchronize")
+    print(f"Payload size: {len(body) / 1024:.1f} KiB, {args.iterations} iterations")
+
+    results = {}
+    for name, parse in (
+        ("full", parse_full),
+        ("lean", parse_lean),
+        ("peek", reject),
+    ):
+        results[name] = measure(parse, body, args.iterations)
+        per_call_us, peak = results[name]
+        print(f"{name:>5}: {per_call_us:8.1f} µs/event  peak {peak / 1024:8.1f} KiB")
+
+    speedup = results["full"][0] / results["lean"][0]
+    print(f"lean is {speedup:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Split a rendered diff into token-budgeted chunks for the LLM.
+
+Files are packed together in diff order until a chunk reaches the budget.
+A file that is larger than the budget on its own is split at hunk
+boundaries; a single hunk is never split.
+"""
+
+from dataclasses import dataclass, field
+from typing import Iterable, List, Tuple
+
+from unidiff.patch import Hunk, PatchedFile
+
+from github.diff import iter_hunk_lines
+
+# Rough average for source code with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class DiffUnit:
+    """One file, or a run of hunks from one file, rendered for the LLM"""
+
+    path: str
+    hunks: List[Hunk]
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+@dataclass
+class DiffChunk:
+    """A group of units reviewed in a single LLM call"""
+
+    units: List[DiffUnit] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "".join(unit.text for unit in self.units)
+
+    @property
+    def tokens(self) -> int:
+        return sum(unit.tokens for unit in self.units)
+
+    @property
+    def files(self) -> List[str]:
+        return list(dict.fromkeys(unit.path for unit in self.units))
+
+
+def split_file(path: str, hunks: List[Hunk], token_budget: int) -> List[DiffUnit]:
+    """Render a file as one unit, or as several hunk runs if it is too big"""
+    header = f"File: {path}\n"
+    hunk_texts = [(hunk, "".join(iter_hunk_lines(hunk))) for hunk in hunks]
+    whole = header + "".join(text for _, text in hunk_texts)
+    if estimate_tokens(whole) <= token_budget:
+        return [DiffUnit(path, hunks, whole)]
+
+    units: List[DiffUnit] = []
+    current: List[Hunk] = []
+    parts: List[str] = [header]
+    tokens = estimate_tokens(header)
+    for hunk, text in hunk_texts:
+        hunk_tokens = estimate_tokens(text)
+        if current and tokens + hunk_tokens > token_budget:
+            units.append(DiffUnit(path, current, "".join(parts)))
+            current, parts, tokens = [], [header], estimate_tokens(header)
+        current.append(hunk)
+        parts.append(text)
+        tokens += hunk_tokens
+    if current:
+        units.append(DiffUnit(path, current, "".join(parts)))
+    return units
+
+
+def pack_units(units: Iterable[DiffUnit], token_budget: int) -> List[DiffChunk]:
+    """Greedily pack units, in order, into chunks of at most ``token_budget``"""
+    chunks: List[DiffChunk] = []
+    current = DiffChunk()
+    for unit in units:
+        if current.units and current.tokens + unit.tokens > token_budget:
+            chunks.append(current)
+            current = DiffChunk()
+        current.units.append(unit)
+    if current.units:
+        chunks.append(current)
+    return chunks
+
+
+def reviewable_hunks(patch: Iterable[PatchedFile]) -> List[Tuple[str, List[Hunk]]]:
+    """(path, hunks) for every file with content; binary files and pure renames have none"""
+    return [
+        (patched_file.path, list(patched_file))
+        for patched_file in patch
+        if len(patched_file)
+    ]
+
+
+def plan_chunks(
+    files: Iterable[Tuple[str, List[Hunk]]], token_budget: int
+) -> List[DiffChunk]:
+    units: List[DiffUnit] = []
+    for path, hunks in files:
+        units.extend(split_file(path, hunks, token_budget))
+    return pack_units(units, token_budget)
@@ -1,60 +1,36 @@
+import asyncio
+import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
-from github.types import GithubPRChanged
+from langchain_core.runnables import Runnable
+from unidiff.patch import Hunk
+from core import metrics, tracing
+from core.chunking import DiffChunk, estimate_tokens, plan_chunks, reviewable_hunks
+from core.llm_gateway import llm_gateway
+from core.review_cache import ReviewCache, default_db_path
+from github.diff import PRDiff
 from testergpt.settings import settings
-from core.types import PRReviewResponse
+from core.types import DiffIssue, ModelRun, PRReviewResponse, ReviewResult
 
+# Bump whenever the prompt changes so cached findings are not reused
+PROMPT_VERSION = "syntax-semantic-v2"
 
-def get_llm(model="gemini-2.5-pro", temperature=0.2):
-    """Return a LangChain LLM instance with proper error handling"""
-    if not settings.GPT_API_KEY or settings.GPT_API_KEY == "sk-YourAIKeyHere":
-        raise ValueError(
-            "Google API key is not configured. Please set GPT_API_KEY in your .env file"
-        )
-
-    try:
-        return ChatGoogleGenerativeAI(
-            model=model,
-            temperature=temperature,
-            google_api_key=settings.GPT_API_KEY,
-            convert_system_message_to_human=True,
-        )
-    except Exception as e:
-        logging.error(f"Failed to initialize LLM client: {e}")
-        raise
-
-
-def review_pr(diff: str) -> PRReviewResponse:
-    """Send a diff to LLM and return structured JSON response"""
-    if not diff or not diff.strip():
-        raise ValueError("Diff content is empty or invalid")
-
-    try:
-        return flow_syntax_and_semantic_check(diff, model="gemini-2.5-pro")
-    except Exception as e:
-        logging.error(f"Error in review_pr: {e}")
-        # Return a fallback response with proper structure
-        fallback_response = PRReviewResponse(
-            issues=[], summary=f"Error occurred during code review: {str(e)}"
-        )
-        return fallback_response
-
-
-def flow_syntax_and_semantic_check(
-    diff: str, model="gemini-2.5-pro"
-) -> PRReviewResponse:
-    """Perform syntax and semantic analysis on code diff"""
-    if not diff or not diff.strip():
-        raise ValueError("Diff content is empty or invalid")
-
-    try:
-        llm = get_llm(model)
-
-        # Create structured output LLM
-        structured_llm = llm.with_structured_output(PRReviewResponse)
-
-        template = """
+SYNTAX_AND_SEMANTIC_TEMPLATE = """
         You are an AI code syntax and semantic analyzer. Focus specifically on syntax validation and semantic correctness of the provided git diff.
 
         Diff:
@@ -63,7 +39,7 @@ def flow_syntax_and_semantic_check(
         ```
         
         SYNTAX AND SEMANTIC ANALYSIS INSTRUCTIONS:
-        - Perform comprehensive syntax validation on all added/modified code (lines starting with '+')
+        - Perform comprehensive syntax validation on all added/modified code (lines marked '+')
         - Check for semantic correctness and logical consistency
         - Validate proper language-specific syntax rules
         - Identify potential runtime errors and type mismatches
@@ -101,29 +77,411 @@ def flow_syntax_and_semantic_check(
         
         For each issue found, specify:
         - type: "error" for syntax errors, "warning" for potential issues, "suggestion" for style improvements
-        - line: Use the NEW file line number from diff hunks for added/modified lines
+        - line: The NEW file line number printed before the added/modified line
         - message: Clear description focusing on syntax/semantic issue
         - severity: "high" for syntax errors, "medium" for semantic issues, "low" for style suggestions
-        - file: Extract file path from diff headers, removing 'a/' or 'b/' prefixes
-        
-        CRITICAL FILE PATH EXTRACTION:
-        - From "diff --git a/path/to/file.py b/path/to/file.py" → use "path/to/file.py"
-        - From "+++ b/path/to/file.py" → use "path/to/file.py"
-        - From "--- a/path/to/file.py" → use "path/to/file.py"
-        - Remove any 'a/' or 'b/' prefixes from file paths
+        - file: The path from the "File:" line of the section the issue is in
         
+        DIFF FORMAT:
+        - Each file starts with a "File: path/to/file.py" line; use that path as-is
+        - Hunks start with "@@ -old_start,old_count +new_start,new_count @@"
+        - Every line is "<new line number> <marker>: <code>" where marker is '+' (added), '-' (removed) or ' ' (context)
+        - Removed lines have no new line number
+
         CRITICAL LINE NUMBER EXTRACTION:
-        - For issues on added lines (starting with +), use the line number from the NEW file
-        - Parse diff hunk headers like @@ -old_start,old_count +new_start,new_count @@
-        - Count line numbers from the new_start position for added lines
-        - Only report line numbers for lines that actually exist in the diff
-        
+        - Use the number printed at the start of the line, never count lines yourself
+        - Only report line numbers of added or context lines that appear in the diff
+        - For an issue spanning several lines use a range such as "12-18"
+
         Provide a summary focusing on syntax correctness, semantic validity, and code quality improvements.
         """
 
-        prompt = ChatPromptTemplate.from_template(template)
-        chain = prompt | structured_llm
-        response = chain.invoke({"diff": diff})
+REVIEW_PROMPT = ChatPromptTemplate.from_template(SYNTAX_AND_SEMANTIC_TEMPLATE)
+
+# Streaming replaces structured output with one JSON object per line so each
+# finding can be parsed as soon as its line is complete.
+STREAMING_OUTPUT_TEMPLATE = """
+        OUTPUT FORMAT:
+        - Respond with JSON Lines only: one JSON object per line, no markdown fences, no other text
+        - Emit one line per issue as soon as you find it:
+          {{"type": "...", "line": "...", "message": "...", "severity": "...", "file": "..."}}
+        - Finish with exactly one summary line: {{"summary": "..."}}
+        """
+
+STREAMING_REVIEW_PROMPT = ChatPromptTemplate.from_template(
+    SYNTAX_AND_SEMANTIC_TEMPLATE + STREAMING_OUTPUT_TEMPLATE
+)
+
+IssueCallback = Callable[[DiffIssue], None]
+# Called between streamed fragments; raises to stop generating
+Checkpoint = Callable[[], None]
+
+review_cache = ReviewCache(
+    maxsize=settings.REVIEW_CACHE_SIZE,
+    prompt_version=PROMPT_VERSION,
+    db_path=default_db_path(),
+)
+
+
+def get_llm(model=settings.LLM_MODEL, temperature=settings.LLM_TEMPERATURE):
+    """Return the shared LangChain LLM instance for (model, temperature)"""
+    return llm_registry.llm(model, temperature)
+
+
+def _build_llm(model: str, temperature: float) -> ChatGoogleGenerativeAI:
+    """Return a LangChain LLM instance with proper error handling"""
+    if not settings.GPT_API_KEY or settings.GPT_API_KEY == "sk-YourAIKeyHere":
+        raise ValueError(
+            "Google API key is not configured. Please set GPT_API_KEY in your .env file"
+        )
+
+    endpoint = {}
+    if settings.LLM_API_ENDPOINT:
+        endpoint = {
+            "transport": "rest",
+            "client_options": {"api_endpoint": settings.LLM_API_ENDPOINT},
+        }
+
+    try:
+        return ChatGoogleGenerativeAI(
+            model=model,
+            temperature=temperature,
+            google_api_key=settings.GPT_API_KEY,
+            convert_system_message_to_human=True,
+            # Retries happen in the LLM gateway, which also adapts concurrency
+            max_retries=1,
+            **endpoint,
+        )
+    except Exception as e:
+        logging.error(f"Failed to initialize LLM client: {e}")
+        raise
+
+
+class LLMRegistry:
+    """
+    Process-wide, thread-safe registry of LLM clients and compiled review
+    chains keyed by (model, temperature). Each is built once and reused so
+    reviews skip client setup and keep connections to the endpoint warm.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._llms: Dict[Tuple[str, float], ChatGoogleGenerativeAI] = {}
+        self._chains: Dict[Tuple[str, float], Runnable] = {}
+        self._stream_chains: Dict[Tuple[str, float], Runnable] = {}
+
+    def llm(
+        self, model: str, temperature: float = settings.LLM_TEMPERATURE
+    ) -> ChatGoogleGenerativeAI:
+        key = (model, temperature)
+        llm = self._llms.get(key)
+        if llm is None:
+            with self._lock:
+                llm = self._llms.get(key)
+                if llm is None:
+                    llm = _build_llm(model, temperature)
+                    self._llms[key] = llm
+        return llm
+
+    def chain(
+        self, model: str, temperature: float = settings.LLM_TEMPERATURE
+    ) -> Runnable:
+        """Review prompt piped into the model's structured output"""
+        key = (model, temperature)
+        chain = self._chains.get(key)
+        if chain is None:
+            structured_llm = self.llm(model, temperature).with_structured_output(
+                PRReviewResponse
+            )
+            with self._lock:
+                chain = self._chains.setdefault(key, REVIEW_PROMPT | structured_llm)
+        return chain
+
+    def stream_chain(
+        self, model: str, temperature: float = settings.LLM_TEMPERATURE
+    ) -> Runnable:
+        """JSON Lines review prompt piped into the raw model, for ``.stream``"""
+        key = (model, temperature)
+        chain = self._stream_chains.get(key)
+        if chain is None:
+            llm = self.llm(model, temperature)
+            with self._lock:
+                chain = self._stream_chains.setdefault(
+                    key, STREAMING_REVIEW_PROMPT | llm
+                )
+        return chain
+
+    def warm_up(self, models: Iterable[str]) -> None:
+        """Build clients and chains ahead of the first review"""
+        for model in models:
+            try:
+                self.chain(model)
+                if settings.LLM_STREAMING:
+                    self.stream_chain(model)
+                print(f"🔥 Warmed up LLM chain for {model}")
+            except Exception as e:
+                print(f"⚠️ Could not warm up LLM chain for {model}: {e}")
+
+
+llm_registry = LLMRegistry()
+
+
+class ModelTier(NamedTuple):
+    name: str
+    model: str
+
+
+def route_model(chunk: DiffChunk) -> ModelTier:
+    """
+    Pick the model for a chunk. Chunks that only touch low-risk files, or
+    that are small and span few files, go to the fast model; everything
+    else goes to the pro model.
+    """
+    fast = ModelTier("fast", settings.LLM_FAST_MODEL)
+    pro = ModelTier("pro", settings.LLM_MODEL)
+
+    extensions = {PurePosixPath(path).suffix.lower() for path in chunk.files}
+    if extensions <= set(settings.LLM_ROUTER_LOW_RISK_EXTENSIONS):
+        return fast
+    if (
+        chunk.tokens <= settings.LLM_ROUTER_FAST_MAX_TOKENS
+        and len(chunk.files) <= settings.LLM_ROUTER_FAST_MAX_FILES
+    ):
+        return fast
+    return pro
+
+
+class ChunkReview(NamedTuple):
+    response: Optional[PRReviewResponse]
+    error: Optional[Exception]
+    run: ModelRun
+
+
+def review_diff(
+    pr_diff: PRDiff,
+    on_issue: Optional[IssueCallback] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> ReviewResult:
+    """
+    Review a parsed diff in token-budgeted chunks on a bounded thread pool
+    and merge the results. Hunks reviewed before are served from the review
+    cache and each chunk is routed to a model tier. Raises if every chunk
+    failed so the job is retried instead of posting an empty review.
+
+    With ``on_issue`` the model output is streamed and every finding,
+    cached ones included, is passed to the callback as soon as it is known.
+    The callback may be called from several threads. ``checkpoint`` is
+    called between streamed fragments and may raise to abort the stream.
+    """
+    with tracing.span("llm.review", streaming=on_issue is not None) as span:
+        cached_issues, cache_hits, chunks = _plan_review(pr_diff)
+        span.set_attributes(chunks=len(chunks), cache_hits=cache_hits)
+        if on_issue is not None:
+            for issue in cached_issues:
+                on_issue(issue)
+        if not chunks:
+            return _cached_result(cached_issues, cache_hits)
+
+        if len(chunks) == 1:
+            results = [_review_chunk(chunks[0], on_issue, checkpoint)]
+        else:
+            workers = min(settings.LLM_REVIEW_CONCURRENCY, len(chunks))
+            review = tracing.bind(
+                lambda chunk: _review_chunk(chunk, on_issue, checkpoint)
+            )
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="llm"
+            ) as pool:
+                results = list(pool.map(review, chunks))
+
+        result = merge_reviews(chunks, results, cached_issues, cache_hits)
+        span.set_attribute("issues", len(result.issues))
+        return result
+
+
+async def areview_diff(pr_diff: PRDiff) -> ReviewResult:
+    """
+    ``review_diff`` for the event loop: chunks are reviewed concurrently
+    with ``ainvoke``, at most LLM_REVIEW_CONCURRENCY at a time per review.
+    Diff parsing and review cache access run in worker threads.
+    """
+    with tracing.span("llm.review", streaming=False) as span:
+        # Parsing, rendering and the SQLite cache lookups block
+        cached_issues, cache_hits, chunks = await asyncio.to_thread(
+            tracing.bind(_plan_review), pr_diff
+        )
+        span.set_attributes(chunks=len(chunks), cache_hits=cache_hits)
+        if not chunks:
+            return _cached_result(cached_issues, cache_hits)
+
+        semaphore = asyncio.Semaphore(settings.LLM_REVIEW_CONCURRENCY)
+
+        async def review(chunk: DiffChunk) -> ChunkReview:
+            async with semaphore:
+                return await _areview_chunk(chunk)
+
+        results = await asyncio.gather(*(review(chunk) for chunk in chunks))
+        result = merge_reviews(chunks, list(results), cached_issues, cache_hits)
+        span.set_attribute("issues", len(result.issues))
+        return result
+
+
+def _plan_review(pr_diff: PRDiff) -> Tuple[List[DiffIssue], int, List[DiffChunk]]:
+    """Cached findings, cache hit count and the chunks still to review"""
+    cached_issues: List[DiffIssue] = []
+    cache_hits = 0
+    pending: List[Tuple[str, List[Hunk]]] = []
+    for path, hunks in reviewable_hunks(pr_diff.patch):
+        missing = []
+        for hunk in hunks:
+            issues = review_cache.get(path, hunk)
+            if issues is None:
+                missing.append(hunk)
+            else:
+                cache_hits += 1
+                cached_issues.extend(issues)
+        if missing:
+            pending.append((path, missing))
+
+    chunks = plan_chunks(pending, settings.LLM_CHUNK_TOKEN_BUDGET)
+    if cache_hits:
+        print(f"♻️ Reusing cached findings for {cache_hits} hunks")
+    if chunks:
+        print(
+            f"🧩 Reviewing diff in {len(chunks)} chunks "
+            f"(largest {max(chunk.tokens for chunk in chunks)} tokens)"
+        )
+    return cached_issues, cache_hits, chunks
+
+
+def _cached_result(cached_issues: List[DiffIssue], cache_hits: int) -> ReviewResult:
+    if not cache_hits:
+        return ReviewResult(issues=[], summary="No reviewable changes found.")
+    return ReviewResult(
+        issues=cached_issues,
+        summary=f"All {cache_hits} changed hunks were reviewed before; "
+        f"reusing {len(cached_issues)} earlier findings.",
+    )
+
+
+def _review_chunk(
+    chunk: DiffChunk,
+    on_issue: Optional[IssueCallback] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> ChunkReview:
+    tier = route_model(chunk)
+    started = time.perf_counter()
+    try:
+        if on_issue is not None:
+            response = stream_syntax_and_semantic_check(
+                chunk.text, on_issue, model=tier.model, checkpoint=checkpoint
+            )
+        else:
+            response = flow_syntax_and_semantic_check(chunk.text, model=tier.model)
+        error = None
+    except Exception as e:
+        logging.error(f"Error reviewing chunk {chunk.files}: {e}")
+        response, error = None, e
+    return _finish_chunk(chunk, tier, started, response, error)
+
+
+async def _areview_chunk(chunk: DiffChunk) -> ChunkReview:
+    tier = route_model(chunk)
+    started = time.perf_counter()
+    try:
+        response = await aflow_syntax_and_semantic_check(chunk.text, model=tier.model)
+        error = None
+    except Exception as e:
+        logging.error(f"Error reviewing chunk {chunk.files}: {e}")
+        response, error = None, e
+    # Storing the findings writes to the SQLite review cache
+    return await asyncio.to_thread(
+        tracing.bind(_finish_chunk), chunk, tier, started, response, error
+    )
+
+
+def _finish_chunk(
+    chunk: DiffChunk,
+    tier: ModelTier,
+    started: float,
+    response: Optional[PRReviewResponse],
+    error: Optional[Exception],
+) -> ChunkReview:
+    run = ModelRun(
+        tier=tier.name,
+        model=tier.model,
+        latency_ms=round((time.perf_counter() - started) * 1000, 1),
+        tokens=chunk.tokens,
+        files=chunk.files,
+        ok=error is None,
+    )
+    print(
+        f"⏱️ {tier.name} tier ({tier.model}) reviewed {chunk.tokens} tokens in {run.latency_ms:.0f} ms"
+    )
+    if response is not None:
+        review_cache.put_reviewed(
+            ((unit.path, unit.hunks) for unit in chunk.units), response.issues
+        )
+    return ChunkReview(response, error, run)
+
+
+def merge_reviews(
+    chunks: List[DiffChunk],
+    results: List[ChunkReview],
+    cached_issues: Optional[List[DiffIssue]] = None,
+    cache_hits: int = 0,
+) -> ReviewResult:
+    """Combine per-chunk reviews into one response with a combined summary"""
+    failures = [result.error for result in results if result.error is not None]
+    if failures and len(failures) == len(results):
+        raise RuntimeError(f"All {len(results)} review chunks failed: {failures[0]}")
+
+    runs = [result.run for result in results]
+    cached_issues = cached_issues or []
+    if len(results) == 1 and not cache_hits:
+        response = results[0].response
+        return ReviewResult(issues=response.issues, summary=response.summary, runs=runs)
+
+    issues = list(cached_issues)
+    summaries = []
+    for index, (chunk, result) in enumerate(zip(chunks, results), 1):
+        files = ", ".join(f"`{path}`" for path in chunk.files)
+        if result.error is not None:
+            summaries.append(
+                f"**Part {index}/{len(chunks)}** ({files}): not reviewed ({result.error})"
+            )
+            continue
+        issues.extend(result.response.issues)
+        summaries.append(
+            f"**Part {index}/{len(chunks)}** ({files}): {result.response.summary}"
+        )
+    if cache_hits:
+        summaries.append(
+            f"{cache_hits} unchanged hunks were reviewed before; "
+            f"{len(cached_issues)} earlier findings reused."
+        )
+
+    return ReviewResult(issues=issues, summary="\n\n".join(summaries), runs=runs)
+
+
+def flow_syntax_and_semantic_check(
+    diff: str, model=settings.LLM_MODEL
+) -> PRReviewResponse:
+    """Perform syntax and semantic analysis on code diff"""
+    if not diff or not diff.strip():
+        raise ValueError("Diff content is empty or invalid")
+
+    try:
+        # Client, structured output wrapper and prompt are built once per model
+        chain = llm_registry.chain(model)
+        tokens = estimate_tokens(diff)
+        with tracing.span("llm.call", model=model, tokens=tokens) as span:
+            # Admission, retries and backoff are handled by the gateway
+            response = llm_gateway.call(
+                lambda: chain.invoke({"diff": diff}), tokens=tokens, model=model
+            )
+            span.set_attribute("issues", len(response.issues) if response else 0)
+        _count_tokens(model, tokens, response)
 
         if not response:
             raise RuntimeError("Empty response from LLM")
@@ -133,9 +491,145 @@ def flow_syntax_and_semantic_check(
 
     except Exception as e:
         logging.error(f"Error in syntax_and_lint_check: {e}")
-        # Return a fallback response with proper structure
-        fallback_response = PRReviewResponse(
-            issues=[],
-            summary=f"Error occurred during syntax and semantic analysis: {str(e)}",
+        raise
+
+
+async def aflow_syntax_and_semantic_check(
+    diff: str, model=settings.LLM_MODEL
+) -> PRReviewResponse:
+    """``flow_syntax_and_semantic_check`` with ``ainvoke``"""
+    if not diff or not diff.strip():
+        raise ValueError("Diff content is empty or invalid")
+
+    try:
+        chain = llm_registry.chain(model)
+        tokens = estimate_tokens(diff)
+
+        def invoke():
+            if settings.LLM_API_ENDPOINT:
+                # The async Gemini client only speaks gRPC, so an endpoint
+                # that serves REST is called through the sync client
+                return asyncio.to_thread(tracing.bind(chain.invoke), {"diff": diff})
+            return chain.ainvoke({"diff": diff})
+
+        with tracing.span("llm.call", model=model, tokens=tokens) as span:
+            response = await llm_gateway.acall(invoke, tokens=tokens, model=model)
+            span.set_attribute("issues", len(response.issues) if response else 0)
+        _count_tokens(model, tokens, response)
+        if not response:
+            raise RuntimeError("Empty response from LLM")
+        return response
+
+    except Exception as e:
+        logging.error(f"Error in syntax_and_lint_check: {e}")
+        raise
+
+
+def stream_syntax_and_semantic_check(
+    diff: str,
+    on_issue: IssueCallback,
+    model=settings.LLM_MODEL,
+    checkpoint: Optional[Checkpoint] = None,
+) -> PRReviewResponse:
+    """
+    Streaming variant of ``flow_syntax_and_semantic_check``: each finding is
+    validated and handed to ``on_issue`` as soon as its line arrives. Returns
+    the complete response once the stream ends; an exception from
+    ``checkpoint`` ends it early.
+    """
+    if not diff or not diff.strip():
+        raise ValueError("Diff content is empty or invalid")
+
+    issues: List[DiffIssue] = []
+    chain = llm_registry.stream_chain(model)
+
+    def fragments() -> Iterator[str]:
+        for chunk in chain.stream({"diff": diff}):
+            if checkpoint is not None:
+                checkpoint()
+            yield _message_text(chunk)
+
+    def consume() -> Optional[str]:
+        summary = None
+        for item in iter_json_lines(fragments()):
+            if "summary" in item and "message" not in item:
+                summary = str(item["summary"])
+                continue
+            try:
+                issue = DiffIssue(**item)
+            except Exception as e:
+                logging.warning(f"Skipping malformed streamed finding {item}: {e}")
+                continue
+            issues.append(issue)
+            on_issue(issue)
+        return summary
+
+    # A failed stream is only retried if nothing was handed out yet
+    tokens = estimate_tokens(diff)
+    with tracing.span("llm.call", model=model, tokens=tokens, streaming=True) as span:
+        summary = llm_gateway.call(
+            consume, tokens=tokens, can_retry=lambda: not issues, model=model
         )
-        return fallback_response
+        span.set_attribute("issues", len(issues))
+    if summary is None and not issues:
+        _count_tokens(model, tokens, None)
+        raise RuntimeError("Empty response from LLM")
+    response = PRReviewResponse(issues=issues, summary=summary or "Review completed.")
+    _count_tokens(model, tokens, response)
+    return response
+
+
+def _count_tokens(
+    model: str, tokens_in: int, response: Optional[PRReviewResponse]
+) -> None:
+    """
+    Estimated tokens per model; the structured output wrappers do not
+    expose the provider's usage metadata
+    """
+    metrics.LLM_TOKENS.labels(model, "in").inc(tokens_in)
+    if response is not None:
+        metrics.LLM_TOKENS.labels(model, "out").inc(
+            estimate_tokens(response.model_dump_json())
+        )
+
+
+def iter_json_lines(fragments: Iterable[str]) -> Iterator[dict]:
+    """
+    Reassemble streamed text fragments into lines and yield every line that
+    is a JSON object. Blank lines, code fences and unparseable lines are
+    skipped.
+    """
+    buffer = ""
+    for fragment in fragments:
+        buffer += fragment
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            item = _parse_json_line(line)
+            if item is not None:
+                yield item
+    item = _parse_json_line(buffer)
+    if item is not None:
+        yield item
+
+
+def _parse_json_line(line: str) -> Optional[dict]:
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError:
+        logging.warning(f"Skipping unparseable streamed line: {line[:200]}")
+        return None
+    return item if isinstance(item, dict) else None
+
+
+def _message_text(chunk) -> str:
+    """Text of a streamed message chunk; Gemini may send a list of parts"""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content
+    )
@@ -0,0 +1,345 @@
+"""
+Admission control for LLM calls.
+
+Every request to the model goes through ``LLMGateway``, which caps the
+number of calls in flight and the tokens sent per minute. The concurrency
+cap adapts with AIMD: it grows by roughly one slot per round of successful
+calls and is halved when the provider throttles (429 / RESOURCE_EXHAUSTED)
+or cut back when latency per token degrades. A burst of 429s answers calls
+admitted under the same limit, so it halves the limit only once. Throttled and transient
+failures are retried with exponential backoff and jitter.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import (
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+import requests
+from google.api_core import exceptions as google_exceptions
+
+from core import metrics
+from testergpt.settings import settings
+
+T = TypeVar("T")
+# Event of a coroutine waiting for a slot, set through its own loop
+_AsyncWaiter = Tuple[asyncio.AbstractEventLoop, asyncio.Event]
+
+_THROTTLED_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+)
+_TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    requests.ConnectionError,
+    requests.Timeout,
+    TimeoutError,
+    ConnectionError,
+)
+_TRANSIENT_STATUSES = frozenset({500, 502, 503, 504})
+# Last resort for errors re-raised by wrappers as plain exceptions: a 429
+# status together with the gRPC status name
+_THROTTLED_TEXT = re.compile(
+    r"\b429\b.*\bresource.?exhausted\b|\bresource.?exhausted\b.*\b429\b",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """'throttled', 'transient' or None for errors that are not worth retrying"""
+    # Wrappers (LangChain, tenacity) keep the provider error as the cause
+    seen = error
+    while seen is not None:
+        if isinstance(seen, _THROTTLED_ERRORS):
+            return "throttled"
+        if isinstance(seen, _TRANSIENT_ERRORS):
+            return "transient"
+        code = getattr(seen, "status_code", None) or getattr(seen, "code", None)
+        if isinstance(code, int):
+            if code == 429:
+                return "throttled"
+            if code in _TRANSIENT_STATUSES:
+                return "transient"
+        seen = seen.__cause__
+
+    if _THROTTLED_TEXT.search(str(error)):
+        return "throttled"
+    return None
+
+
+class GatewayLimits(NamedTuple):
+    concurrency_limit: float
+    in_flight: int
+    tokens_per_minute: int
+    tokens_in_window: int
+    throttled: int
+    retries: int
+
+
+class LLMGateway:
+    """
+    ``call(fn, tokens)`` runs ``fn`` once a concurrency slot and ``tokens``
+    of the per-minute budget are free. ``tokens_per_minute=0`` disables the
+    token limit.
+    """
+
+    def __init__(
+        self,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        tokens_per_minute: int = 0,
+        max_retries: int = 4,
+        retry_base_delay: float = 2.0,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.latency_tolerance = latency_tolerance
+
+        self._limit = float(
+            min(max(initial_concurrency, min_concurrency), max_concurrency)
+        )
+        self._in_flight = 0
+        self._window: Deque[Tuple[float, int]] = deque()
+        self._window_tokens = 0
+        # Smoothed seconds per 1k tokens of healthy calls, per model: a pro
+        # model is slower per token without the provider being overloaded
+        self._baselines: Dict[str, float] = {}
+        self._throttled = 0
+        self._retries = 0
+        # Throttles of calls started before the last halving were caused by
+        # the old limit and do not halve it again
+        self._last_decrease_at = float("-inf")
+        self._condition = threading.Condition()
+        # Coroutines waiting for a slot; the gateway is shared by threads
+        # and event loops, so they are woken through their own loop
+        self._async_waiters: Set[_AsyncWaiter] = set()
+        metrics.LLM_CONCURRENCY_LIMIT.set(self._limit)
+
+    def call(
+        self,
+        fn: Callable[[], T],
+        tokens: int = 0,
+        can_retry: Optional[Callable[[], bool]] = None,
+        model: str = "",
+    ) -> T:
+        """
+        Run ``fn`` under the gateway's limits, retrying throttled and
+        transient failures. ``can_retry`` lets a caller that already
+        produced side effects (e.g. streamed findings) opt out of a retry.
+        Latency is judged against the baseline of ``model``.
+        """
+        attempt = 0
+        while True:
+            self._acquire(tokens)
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                kind = classify_error(e)
+                self._release(kind, started, tokens, model)
+                if (
+                    kind is None
+                    or attempt >= self.max_retries
+                    or (can_retry is not None and not can_retry())
+                ):
+                    raise
+                delay = self._retry_delay(kind, attempt, e)
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            self._release("ok", started, tokens, model)
+            return result
+
+    async def acall(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        tokens: int = 0,
+        can_retry: Optional[Callable[[], bool]] = None,
+        model: str = "",
+    ) -> T:
+        """``call`` for coroutines; waits for a slot without blocking the loop"""
+        attempt = 0
+        while True:
+            await self._aacquire(tokens)
+            started = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                kind = classify_error(e)
+                self._release(kind, started, tokens, model)
+                if (
+                    kind is None
+                    or attempt >= self.max_retries
+                    or (can_retry is not None and not can_retry())
+                ):
+                    raise
+                delay = self._retry_delay(kind, attempt, e)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self._release("ok", started, tokens, model)
+            return result
+
+    def _retry_delay(self, kind: str, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, self.retry_base_delay * 2**attempt)
+        if kind == "throttled":
+            delay += self.retry_base_delay
+        with self._condition:
+            self._retries += 1
+            limit = self._limit
+        logging.warning(
+            f"LLM call {kind} ({error}), retry {attempt + 1}/{self.max_retries} "
+            f"in {delay:.1f}s (limit {limit:.1f})"
+        )
+        return delay
+
+    def _acquire(self, tokens: int) -> None:
+        with self._condition:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait is None:
+                    return
+                self._condition.wait(wait or None)
+
+    async def _aacquire(self, tokens: int) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = (loop, asyncio.Event())
+            wait = self._try_acquire(tokens, waiter)
+            if wait is None:
+                return
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await waiter[1].wait()
+            finally:
+                with self._condition:
+                    self._async_waiters.discard(waiter)
+
+    def _try_acquire(
+        self,
+        tokens: int,
+        waiter: Optional[_AsyncWaiter] = None,
+    ) -> Optional[float]:
+        """
+        Take a slot and the tokens if both are free and return None;
+        otherwise return how long the token window needs, or 0 if waiting
+        for a slot. ``waiter`` is registered under the same lock to be set
+        by the next release, so no release is missed.
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._expire(now)
+            has_slot = self._in_flight < int(self._limit)
+            has_tokens = (
+                not self.tokens_per_minute
+                or not self._window
+                or self._window_tokens + tokens <= self.tokens_per_minute
+            )
+            if not (has_slot and has_tokens):
+                if has_slot and self._window:
+                    # Token budget frees up as the oldest entry leaves the window
+                    return max(self._window[0][0] + 60 - now, 0.01)
+                if waiter is not None:
+                    self._async_waiters.add(waiter)
+                return 0
+
+            self._in_flight += 1
+            metrics.LLM_IN_FLIGHT.inc()
+            if tokens:
+                self._window.append((now, tokens))
+                self._window_tokens += tokens
+            return None
+
+    def _expire(self, now: float) -> None:
+        while self._window and self._window[0][0] <= now - 60:
+            _, tokens = self._window.popleft()
+            self._window_tokens -= tokens
+
+    def _release(
+        self, outcome: Optional[str], started: float, tokens: int, model: str = ""
+    ) -> None:
+        """Free the slot of a call that started at ``started`` (monotonic)"""
+        with self._condition:
+            now = time.monotonic()
+            latency = now - started
+            self._in_flight -= 1
+            if outcome == "throttled":
+                self._throttled += 1
+                if started >= self._last_decrease_at:
+                    self._limit = max(self.min_concurrency, self._limit / 2)
+                    self._last_decrease_at = now
+            elif outcome == "ok":
+                # Small prompts are dominated by fixed overhead, so they are
+                # normalized as if they were 1k tokens
+                per_1k = latency / max(tokens, 1000) * 1000
+                baseline = self._baselines.get(model)
+                if baseline is not None and per_1k > baseline * self.latency_tolerance:
+                    # Queueing at the provider: back off before it throttles
+                    self._limit = max(self.min_concurrency, self._limit * 0.9)
+                else:
+                    self._limit = min(
+                        self.max_concurrency, self._limit + 1 / self._limit
+                    )
+                    self._baselines[model] = (
+                        per_1k if baseline is None else 0.9 * baseline + 0.1 * per_1k
+                    )
+            metrics.LLM_IN_FLIGHT.dec()
+            metrics.LLM_CONCURRENCY_LIMIT.set(self._limit)
+            self._condition.notify_all()
+            for loop, event in self._async_waiters:
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    # The waiter's loop has been closed
+                    pass
+            self._async_waiters.clear()
+
+    def limits(self) -> GatewayLimits:
+        """Current limits and usage"""
+        with self._condition:
+            self._expire(time.monotonic())
+            return GatewayLimits(
+                concurrency_limit=round(self._limit, 2),
+                in_flight=self._in_flight,
+                tokens_per_minute=self.tokens_per_minute,
+                tokens_in_window=self._window_tokens,
+                throttled=self._throttled,
+                retries=self._retries,
+            )
+
+
+llm_gateway = LLMGateway(
+    initial_concurrency=settings.LLM_INITIAL_CONCURRENCY,
+    min_concurrency=settings.LLM_MIN_CONCURRENCY,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    max_retries=settings.LLM_MAX_RETRIES,
+    retry_base_delay=settings.LLM_RETRY_BASE_DELAY,
+    latency_tolerance=settings.LLM_LATENCY_TOLERANCE,
+)
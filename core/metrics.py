@@ -0,0 +1,151 @@
+"""
+Prometheus metrics for the webhook, the review worker and their external
+calls, served by the ``/metrics`` view.
+
+Every process records into its own ``prometheus_client`` metrics; an
+increment is a lock and an add, so they are fine on the hot path. With
+PROMETHEUS_MULTIPROC_DIR set, values are kept in memory-mapped files in
+that directory and ``/metrics`` aggregates the files of all processes, so
+ASGI workers and review workers can be scraped through any one of them.
+The directory must be emptied before the processes start.
+
+Stage latencies come from ``core.tracing`` spans, which are timed even
+when no span exporter is configured.
+"""
+
+import atexit
+import os
+from pathlib import Path
+
+from testergpt.settings import settings
+
+# prometheus_client picks its storage when it is imported
+if settings.PROMETHEUS_MULTIPROC_DIR:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.PROMETHEUS_MULTIPROC_DIR)
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+if MULTIPROCESS:
+    Path(os.environ["PROMETHEUS_MULTIPROC_DIR"]).mkdir(parents=True, exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402,F401
+
+# LLM calls and whole reviews take far longer than the default buckets
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+)
+
+WEBHOOK_DELIVERIES = Counter(
+    "testergpt_webhook_deliveries_total",
+    "Webhook deliveries by event, action and response status",
+    ["event", "action", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "testergpt_stage_seconds",
+    "Duration of pipeline stages, named after their trace spans",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "testergpt_review_queue_wait_seconds",
+    "Time a review job waited between becoming available and starting",
+    buckets=LATENCY_BUCKETS,
+)
+REVIEW_JOBS = Counter(
+    "testergpt_review_jobs_total",
+    "Finished review job attempts by resulting status",
+    ["status"],
+)
+REVIEWS_IN_FLIGHT = Gauge(
+    "testergpt_reviews_in_flight",
+    "Review jobs currently running",
+    multiprocess_mode="livesum",
+)
+LLM_TOKENS = Counter(
+    "testergpt_llm_tokens_total",
+    "Estimated LLM tokens sent (in) and received (out)",
+    ["model", "direction"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "testergpt_llm_calls_in_flight",
+    "LLM calls admitted by the gateway and not finished",
+    multiprocess_mode="livesum",
+)
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "testergpt_llm_concurrency_limit",
+    "Adaptive LLM concurrency limit of the gateway",
+    multiprocess_mode="livesum",
+)
+GITHUB_REQUESTS = Counter(
+    "testergpt_github_requests_total",
+    "GitHub API requests by method, endpoint template and status",
+    ["method", "endpoint", "status"],
+)
+GITHUB_RATE_LIMIT_REMAINING = Gauge(
+    "testergpt_github_rate_limit_remaining",
+    "Last reported primary rate limit budget per installation",
+    ["installation"],
+    multiprocess_mode="livemostrecent",
+)
+CACHE_LOOKUPS = Counter(
+    "testergpt_cache_lookups_total",
+    "Cache lookups by cache and result; hit ratio is hit / (hit + miss)",
+    ["cache", "result"],
+)
+
+
+class CacheStats:
+    """Hit and miss counters of one cache, with the label lookups done once"""
+
+    def __init__(self, cache: str):
+        self._hit = CACHE_LOOKUPS.labels(cache, "hit")
+        self._miss = CACHE_LOOKUPS.labels(cache, "miss")
+
+    def record(self, hit: bool) -> None:
+        (self._hit if hit else self._miss).inc()
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def exposition(*registries: CollectorRegistry) -> bytes:
+    """
+    Metrics of this process, or of every process in multiprocess mode,
+    followed by those of ``registries`` (e.g. collectors that query the
+    database at scrape time)
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return b"".join(generate_latest(r) for r in (registry, *registries))
+
+
+if MULTIPROCESS:
+    # Drop this process from the live gauges once it exits
+    atexit.register(multiprocess.mark_process_dead, os.getpid())
@@ -0,0 +1,170 @@
+"""
+Content-addressed cache of review findings per diff hunk.
+
+A hunk is keyed by its file path, its normalized content and the prompt
+version, so a hunk that reappears after a rebase or force-push is not sent
+to the LLM again. Findings are stored with line numbers relative to the
+hunk start and remapped onto the hunk's new position on a hit.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from unidiff.patch import Hunk
+
+from core import metrics
+from core.types import DiffIssue
+from testergpt.settings import BASE_DIR, settings
+
+
+def hunk_key(path: str, hunk: Hunk, prompt_version: str) -> str:
+    """Hash of the hunk ignoring its position and trailing whitespace"""
+    digest = hashlib.sha256()
+    digest.update(f"{prompt_version}\0{path}\0".encode("utf-8"))
+    for line in hunk:
+        digest.update(f"{line.line_type}{line.value.rstrip()}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def parse_line_range(line: str) -> Optional[Tuple[int, int]]:
+    """Parse "12" or "12-18" into (start, end); None if it is not a number"""
+    try:
+        if "-" in line:
+            start, end = line.split("-", 1)
+            return int(start), int(end)
+        return int(line), int(line)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _shift(line: str, offset: int) -> str:
+    start, end = parse_line_range(line)
+    if start == end:
+        return str(start + offset)
+    return f"{start + offset}-{end + offset}"
+
+
+class ReviewCache:
+    """In-memory LRU with an optional SQLite backing store"""
+
+    def __init__(self, maxsize: int, prompt_version: str, db_path: Optional[Path]):
+        self.maxsize = maxsize
+        self.prompt_version = prompt_version
+        self.stats = metrics.CacheStats("review")
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path is not None:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS hunk_reviews "
+                "(key TEXT PRIMARY KEY, issues TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, path: str, hunk: Hunk) -> Optional[List[DiffIssue]]:
+        """Cached findings for a hunk, remapped onto its current lines"""
+        key = hunk_key(path, hunk, self.prompt_version)
+        with self._lock:
+            stored = self._items.get(key)
+            if stored is not None:
+                self._items.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT issues FROM hunk_reviews WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    stored = row[0]
+                    self._remember(key, stored)
+
+        self.stats.record(stored is not None)
+        if stored is None:
+            return None
+        return [
+            issue.model_copy(
+                update={"file": path, "line": _shift(issue.line, hunk.target_start)}
+            )
+            for issue in (DiffIssue(**item) for item in json.loads(stored))
+        ]
+
+    def put(self, path: str, hunk: Hunk, issues: Iterable[DiffIssue]) -> None:
+        """Store findings for a hunk with lines relative to its start"""
+        key = hunk_key(path, hunk, self.prompt_version)
+        stored = json.dumps(
+            [
+                issue.model_copy(
+                    update={"line": _shift(issue.line, -hunk.target_start)}
+                ).model_dump()
+                for issue in issues
+            ]
+        )
+        with self._lock:
+            self._remember(key, stored)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO hunk_reviews VALUES (?, ?, ?)",
+                    (key, stored, time.time()),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, stored: str) -> None:
+        self._items[key] = stored
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def put_reviewed(
+        self, files: Iterable[Tuple[str, List[Hunk]]], issues: List[DiffIssue]
+    ) -> None:
+        """
+        Attribute the findings of one LLM call to the hunks it covered and
+        cache every hunk, including those without findings. If a finding for
+        a file cannot be placed in one of its hunks, none of that file's
+        hunks are cached, since a hit would silently drop the finding.
+        """
+        for path, hunks in files:
+            by_hunk: List[List[DiffIssue]] = [[] for _ in hunks]
+            placed = True
+            for issue in issues:
+                if not _same_path(issue.file, path):
+                    continue
+                index = _hunk_index(hunks, parse_line_range(issue.line))
+                if index is None:
+                    placed = False
+                    break
+                by_hunk[index].append(issue)
+            if not placed:
+                print(f"⚠️ Not caching {path}: a finding is outside its hunks")
+                continue
+            for hunk, hunk_issues in zip(hunks, by_hunk):
+                self.put(path, hunk, hunk_issues)
+
+
+def _hunk_index(hunks: List[Hunk], lines: Optional[Tuple[int, int]]) -> Optional[int]:
+    """Index of the hunk whose new lines contain ``lines``"""
+    if lines is None:
+        return None
+    for index, hunk in enumerate(hunks):
+        first = hunk.target_start
+        last = hunk.target_start + max(hunk.target_length, 1) - 1
+        if first <= lines[0] and lines[1] <= last:
+            return index
+    return None
+
+
+def _same_path(issue_path: str, diff_path: str) -> bool:
+    return issue_path == diff_path or diff_path.endswith(f"/{issue_path}")
+
+
+def default_db_path() -> Optional[Path]:
+    """SQLite file from REVIEW_CACHE_DB, relative to BASE_DIR; None disables it"""
+    if not settings.REVIEW_CACHE_DB:
+        return None
+    path = Path(settings.REVIEW_CACHE_DB)
+    return path if path.is_absolute() else BASE_DIR / path
@@ -0,0 +1,194 @@
+import asyncio
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from google.api_core import exceptions as google_exceptions
+from unidiff import PatchSet
+
+from core.llm_client import stream_syntax_and_semantic_check
+from core.llm_gateway import LLMGateway, classify_error
+from core.review_cache import ReviewCache
+from core.types import DiffIssue
+from github.posting import ReviewSuperseded
+
+
+class ClassifyErrorTests(SimpleTestCase):
+    def test_provider_errors(self):
+        self.assertEqual(
+            classify_error(google_exceptions.ResourceExhausted("quota")), "throttled"
+        )
+        self.assertEqual(
+            classify_error(google_exceptions.TooManyRequests("slow down")), "throttled"
+        )
+        self.assertEqual(
+            classify_error(google_exceptions.ServiceUnavailable("overloaded")),
+            "transient",
+        )
+        self.assertEqual(
+            classify_error(google_exceptions.DeadlineExceeded("late")), "transient"
+        )
+        self.assertEqual(
+            classify_error(google_exceptions.InternalServerError("oops")), "transient"
+        )
+        self.assertEqual(classify_error(TimeoutError()), "transient")
+        self.assertEqual(classify_error(ConnectionResetError()), "transient")
+
+    def test_wrapped_provider_error(self):
+        try:
+            try:
+                raise google_exceptions.ResourceExhausted("quota")
+            except google_exceptions.ResourceExhausted as e:
+                raise RuntimeError("chain failed") from e
+        except RuntimeError as wrapped:
+            self.assertEqual(classify_error(wrapped), "throttled")
+
+    def test_text_fallback_needs_status_and_name(self):
+        self.assertEqual(
+            classify_error(RuntimeError("429 RESOURCE_EXHAUSTED: quota")), "throttled"
+        )
+        self.assertIsNone(classify_error(RuntimeError("error 429 from upstream")))
+
+    def test_ordinary_errors_are_not_retried(self):
+        for error in (
+            ReviewSuperseded("PR #429 has a newer head"),
+            ValueError("Invalid finding at line 1500"),
+            ValueError("line 503 of the diff"),
+            RuntimeError("internal invariant violated"),
+            KeyError("connection"),
+            RuntimeError("quota field missing from response"),
+        ):
+            with self.subTest(error=error):
+                self.assertIsNone(classify_error(error))
+
+
+class LLMGatewayTests(SimpleTestCase):
+    def complete(self, gateway, model, seconds_per_1k):
+        self.assertIsNone(gateway._try_acquire(1000))
+        gateway._release("ok", time.monotonic() - seconds_per_1k, 1000, model)
+
+    def test_baseline_is_per_model(self):
+        gateway = LLMGateway(initial_concurrency=4, max_concurrency=16)
+        # The pro tier is steadily 5x slower per token than the fast tier
+        for _ in range(20):
+            self.complete(gateway, "fast", 1.0)
+            self.complete(gateway, "pro", 5.0)
+        self.assertGreater(gateway.limits().concurrency_limit, 4)
+
+    def test_latency_regression_backs_off(self):
+        gateway = LLMGateway(initial_concurrency=8, max_concurrency=16)
+        self.complete(gateway, "fast", 1.0)
+        before = gateway.limits().concurrency_limit
+        for _ in range(5):
+            self.complete(gateway, "fast", 5.0)
+        self.assertLess(gateway.limits().concurrency_limit, before)
+
+    def test_burst_of_throttles_halves_the_limit_once(self):
+        gateway = LLMGateway(initial_concurrency=8, max_concurrency=16)
+        started = time.monotonic()
+        for _ in range(8):
+            self.assertIsNone(gateway._try_acquire(0))
+        for _ in range(8):
+            gateway._release("throttled", started, 0)
+        self.assertEqual(gateway.limits().concurrency_limit, 4)
+
+        # A call admitted under the halved limit is throttled again
+        self.assertIsNone(gateway._try_acquire(0))
+        gateway._release("throttled", time.monotonic(), 0)
+        self.assertEqual(gateway.limits().concurrency_limit, 2)
+
+    def test_async_waiter_is_woken_by_a_release_from_another_thread(self):
+        gateway = LLMGateway(initial_concurrency=1, max_concurrency=1)
+        self.assertIsNone(gateway._try_acquire(0))
+
+        async def call():
+            return "done"
+
+        async def run():
+            waiting = asyncio.create_task(gateway.acall(call))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiting.done())
+            await asyncio.to_thread(gateway._release, "ok", time.monotonic(), 0)
+            return await asyncio.wait_for(waiting, timeout=1)
+
+        self.assertEqual(asyncio.run(run()), "done")
+        self.assertEqual(gateway.limits().in_flight, 0)
+
+
+REVIEW_DIFF = """\
+diff --git a/src/app.py b/src/app.py
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,2 +1,3 @@
+ import os
++import sys
+ 
+@@ -10,2 +11,3 @@
+ def main():
++    run()
+     return 0
+diff --git a/src/util.py b/src/util.py
+--- a/src/util.py
++++ b/src/util.py
+@@ -1,1 +1,2 @@
+ x = 1
++y = 2
+"""
+
+
+def issue(file, line):
+    return DiffIssue(type="semantic", line=line, message="m", severity="low", file=file)
+
+
+class ReviewCachePutReviewedTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = ReviewCache(maxsize=16, prompt_version="test", db_path=None)
+        self.files = [
+            (patched.path, list(patched)) for patched in PatchSet(REVIEW_DIFF)
+        ]
+
+    def cached(self, index, hunk):
+        path, hunks = self.files[index]
+        return self.cache.get(path, hunks[hunk])
+
+    def test_findings_are_cached_with_their_hunk(self):
+        self.cache.put_reviewed(self.files, [issue("src/app.py", "12")])
+        self.assertEqual(self.cached(0, 0), [])
+        self.assertEqual([i.line for i in self.cached(0, 1)], ["12"])
+        self.assertEqual(self.cached(1, 0), [])
+
+    def test_file_with_an_unplaced_finding_is_not_cached(self):
+        for line in ("40", "11-40", "near main", ""):
+            with self.subTest(line=line):
+                self.cache = ReviewCache(maxsize=16, prompt_version="t", db_path=None)
+                self.cache.put_reviewed(
+                    self.files, [issue("src/app.py", "2"), issue("src/app.py", line)]
+                )
+                self.assertIsNone(self.cached(0, 0))
+                self.assertIsNone(self.cached(0, 1))
+                # Other files of the same call are unaffected
+                self.assertEqual(self.cached(1, 0), [])
+
+
+class StreamCheckpointTests(SimpleTestCase):
+    def test_checkpoint_aborts_a_stream_between_fragments(self):
+        streamed = []
+
+        def stream(inputs):
+            while True:
+                streamed.append(None)
+                yield " "
+
+        def checkpoint():
+            if len(streamed) > 3:
+                raise ReviewSuperseded("newer head")
+
+        chain = mock.Mock(stream=stream)
+        with mock.patch(
+            "core.llm_client.llm_registry.stream_chain", return_value=chain
+        ):
+            with self.assertRaises(ReviewSuperseded):
+                stream_syntax_and_semantic_check(
+                    "+x = 1", lambda issue: None, checkpoint=checkpoint
+                )
+        self.assertEqual(len(streamed), 4)
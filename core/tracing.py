@@ -0,0 +1,343 @@
+"""
+Lightweight tracing for the review pipeline.
+
+``span(name, **attributes)`` times a block and nests under whatever span
+is active in the current context (a ``ContextVar``, so it follows asyncio
+tasks; use ``bind`` for thread pools). Finished spans are exported in the
+background as JSON Lines or as OTLP/HTTP JSON to a local collector.
+
+A queued ``ReviewJob`` stores the W3C ``traceparent`` of the webhook span,
+so the worker's spans for that delivery land in the same trace.
+
+Every span is timed into the ``core.metrics`` stage histogram; with
+TRACING_EXPORTER unset spans are not exported.
+"""
+
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, TypeVar, Union
+
+import requests
+
+from core import metrics
+from testergpt.settings import BASE_DIR, settings
+
+T = TypeVar("T")
+
+AttributeValue = Union[str, int, float, bool]
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation; use as a context manager"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "error",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        attributes: Dict[str, Any],
+        trace_id: str,
+        parent_id: Optional[str],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: AttributeValue) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        metrics.observe_stage(self.name, self.duration_ms / 1000)
+        if settings.TRACING_EXPORTER:
+            _exporter().submit(self)
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stand-in returned by ``current_span`` outside of any span"""
+
+    trace_id = span_id = parent_id = None
+    traceparent = ""
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        pass
+
+    def set_attributes(self, **attributes: AttributeValue) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _parse_traceparent(traceparent: str):
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+def span(name: str, parent: Optional[str] = None, **attributes: AttributeValue) -> Span:
+    """
+    Start a span under the active one, or under ``parent`` (a traceparent
+    string) when given, e.g. to continue a trace across the job queue.
+    """
+    trace_id = parent_id = None
+    if parent:
+        trace_id, parent_id = _parse_traceparent(parent)
+    if trace_id is None:
+        active = _current.get()
+        if active is not None:
+            trace_id, parent_id = active.trace_id, active.span_id
+        else:
+            trace_id = f"{random.getrandbits(128):032x}"
+    return Span(name, attributes, trace_id, parent_id)
+
+
+def current_span() -> Union[Span, _NoopSpan]:
+    return _current.get() or NOOP_SPAN
+
+
+def traceparent() -> str:
+    """W3C traceparent of the active span, empty when there is none"""
+    active = _current.get()
+    return active.traceparent if active is not None else ""
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """Run ``fn`` under the active span when it is called from another thread"""
+    parent = _current.get()
+    if parent is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+class SpanExporter:
+    """
+    Buffers finished spans and writes them from a daemon thread every
+    ``interval`` seconds or ``batch_size`` spans. Spans beyond ``max_queue``
+    are dropped rather than blocking the pipeline.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Span]], None],
+        interval: float = 2.0,
+        batch_size: int = 512,
+        max_queue: int = 10000,
+    ):
+        self.write = write
+        self.interval = interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: Deque[Span] = deque(maxlen=max_queue)
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, finished: Span) -> None:
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(finished)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    print(f"⚠️ Could not export {len(batch)} spans: {e}")
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+
+def jsonl_writer(path: Path) -> Callable[[List[Span]], None]:
+    """One JSON object per span, appended to ``path``"""
+
+    def write(spans: List[Span]) -> None:
+        with path.open("a", encoding="utf-8") as f:
+            for finished in spans:
+                f.write(json.dumps(finished.as_dict(), default=str) + "\n")
+
+    return write
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_writer(endpoint: str, service_name: str) -> Callable[[List[Span]], None]:
+    """OTLP/HTTP with the JSON encoding, e.g. to a collector on :4318"""
+    session = requests.Session()
+    resource = {
+        "attributes": [
+            {"key": "service.name", "value": {"stringValue": service_name}},
+            {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+        ]
+    }
+
+    def write(spans: List[Span]) -> None:
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": resource,
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "testergpt"},
+                            "spans": [_otlp_span(finished) for finished in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        response = session.post(endpoint, json=body, timeout=5)
+        response.raise_for_status()
+
+    return write
+
+
+def _otlp_span(finished: Span) -> dict:
+    otlp = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        "kind": 1,
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.end_ns),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in finished.attributes.items()
+        ],
+        # STATUS_CODE_OK / STATUS_CODE_ERROR
+        "status": (
+            {"code": 2, "message": finished.error} if finished.error else {"code": 1}
+        ),
+    }
+    if finished.parent_id:
+        otlp["parentSpanId"] = finished.parent_id
+    return otlp
+
+
+_exporter_lock = threading.Lock()
+_exporter_instance: Optional[SpanExporter] = None
+
+
+def _exporter() -> SpanExporter:
+    global _exporter_instance
+    if _exporter_instance is None:
+        with _exporter_lock:
+            if _exporter_instance is None:
+                _exporter_instance = _build_exporter()
+    return _exporter_instance
+
+
+def _build_exporter() -> SpanExporter:
+    kind = settings.TRACING_EXPORTER.lower()
+    if kind == "otlp":
+        write = otlp_writer(
+            settings.TRACING_OTLP_ENDPOINT, settings.TRACING_SERVICE_NAME
+        )
+    elif kind == "jsonl":
+        path = Path(settings.TRACING_JSONL_FILE)
+        write = jsonl_writer(path if path.is_absolute() else BASE_DIR / path)
+    else:
+        print(
+            f"⚠️ Unknown TRACING_EXPORTER {settings.TRACING_EXPORTER!r}, dropping spans"
+        )
+        write = lambda spans: None  # noqa: E731
+    print(f"🔭 Exporting spans with the {kind} exporter")
+    return SpanExporter(write, interval=settings.TRACING_FLUSH_SECONDS)
+
+
+def flush() -> None:
+    """Write out buffered spans, e.g. before a short-lived command exits"""
+    if _exporter_instance is not None:
+        _exporter_instance.flush()
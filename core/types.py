@@ -31,3 +31,22 @@ class PRReviewResponse(BaseModel):
         default_factory=list, description="List of issues found in the diff"
     )
     summary: str = Field(..., description="Overall assessment of the changes")
+
+
+class ModelRun(BaseModel):
+    """One LLM call made while producing a review"""
+
+    tier: str = Field(..., description="Router tier: fast or pro")
+    model: str = Field(..., description="Model name the chunk was sent to")
+    latency_ms: float = Field(..., description="Wall-clock time of the call")
+    tokens: int = Field(..., description="Estimated tokens of the rendered diff")
+    files: List[str] = Field(default_factory=list, description="Files in the chunk")
+    ok: bool = Field(True, description="False if the call failed")
+
+
+class ReviewResult(PRReviewResponse):
+    """Merged review plus how it was produced; not part of the LLM schema"""
+
+    runs: List[ModelRun] = Field(
+        default_factory=list, description="LLM calls made for this review"
+    )
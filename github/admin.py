@@ -1,3 +1,20 @@
 from django.contrib import admin
 
-# Register your models here.
+from github.models import ReviewJob
+
+
+@admin.register(ReviewJob)
+class ReviewJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "repository",
+        "pr_number",
+        "action",
+        "status",
+        "attempts",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "action")
+    search_fields = ("repository", "delivery_id", "head_sha")
+    readonly_fields = ("payload",)
@@ -0,0 +1,452 @@
+"""
+Pooled HTTP clients for the GitHub REST API.
+
+Every call to api.github.com goes through ``GitHubClient`` (threads) or
+``AsyncGitHubClient`` (event loop) so connections are reused across
+requests, timeouts are always applied and the common headers live in one
+place. Both share one rate limit scheduler per process.
+"""
+
+import asyncio
+import re
+import threading
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core import metrics, tracing
+from github.ratelimit import RateLimitScheduler, is_rate_limited
+from testergpt.settings import settings
+
+DEFAULT_API_URL = "https://api.github.com"
+GITHUB_API_VERSION = "2022-11-28"
+
+ACCEPT_JSON = "application/vnd.github+json"
+ACCEPT_DIFF = "application/vnd.github.diff"
+
+DEFAULT_HEADERS = {
+    "Accept": ACCEPT_JSON,
+    "X-GitHub-Api-Version": GITHUB_API_VERSION,
+    "User-Agent": "testergpt",
+}
+RETRY_STATUSES = (502, 503, 504)
+
+Timeout = Union[float, Tuple[float, float]]
+
+# Path segments replaced by placeholders so metrics have bounded labels
+_ENDPOINT_PARAMS = (
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{repo}"),
+    (re.compile(r"/compare/[^/]+"), "/compare/{range}"),
+    (re.compile(r"/\d+(?=/|$)"), "/{id}"),
+)
+
+
+def resolve_url(base_url: str, path: str) -> str:
+    """Resolve an API path, or an absolute api.github.com URL, to ``base_url``"""
+    if path.startswith(DEFAULT_API_URL):
+        path = path[len(DEFAULT_API_URL) :]
+    if path.startswith("http://") or path.startswith("https://"):
+        return path
+    return f"{base_url}/{path.lstrip('/')}"
+
+
+def endpoint_template(path: str) -> str:
+    """``/repos/o/r/pulls/7/comments?page=2`` -> ``/repos/{repo}/pulls/{id}/comments``"""
+    endpoint = "/" + urlsplit(path).path.lstrip("/")
+    for pattern, placeholder in _ENDPOINT_PARAMS:
+        endpoint = pattern.sub(placeholder, endpoint)
+    return endpoint
+
+
+class GitHubClient:
+    """
+    Thin wrapper around one ``requests.Session`` per installation.
+
+    ``base_url`` can point at a local stub server; absolute api.github.com
+    URLs taken from webhook payloads are rewritten onto it as well.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_API_URL,
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        max_retries: int = 3,
+        rate_limiter: Optional[RateLimitScheduler] = None,
+        rate_limit_retries: int = 3,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or RateLimitScheduler()
+        self.rate_limit_retries = rate_limit_retries
+        self._sessions: Dict[Optional[int], requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session(self, installation_id: Optional[int] = None) -> requests.Session:
+        """Return the pooled session for an installation, creating it once"""
+        session = self._sessions.get(installation_id)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(installation_id)
+            if session is None:
+                session = self._build_session()
+                self._sessions[installation_id] = session
+            return session
+
+    def _build_session(self) -> requests.Session:
+        # Only idempotent requests are retried on 5xx; connection errors are
+        # retried for every method because nothing reached GitHub yet.
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(DEFAULT_HEADERS)
+        return session
+
+    def url(self, path: str) -> str:
+        return resolve_url(self.base_url, path)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        installation_id: Optional[int] = None,
+        token: Optional[str] = None,
+        accept: Optional[str] = None,
+        timeout: Optional[Timeout] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Send a request authenticated with ``token`` or, when only
+        ``installation_id`` is given, with the cached installation token.
+        """
+        from github.utils import installation_tokens
+
+        headers = kwargs.pop("headers", None) or {}
+        if accept:
+            headers["Accept"] = accept
+
+        auth_token = token
+        if auth_token is None and installation_id is not None:
+            auth_token = installation_tokens.get_token(installation_id)
+        if auth_token:
+            headers["Authorization"] = f"Bearer {auth_token}"
+
+        with tracing.span("github.request", method=method, path=path) as span:
+            response = self._send(
+                method, path, installation_id, headers, timeout, kwargs
+            )
+
+            # An installation token can be revoked before it expires; fetch a
+            # new one and retry once.
+            if response.status_code == 401 and token is None and installation_id:
+                installation_tokens.invalidate(installation_id)
+                headers["Authorization"] = (
+                    f"Bearer {installation_tokens.get_token(installation_id)}"
+                )
+                response = self._send(
+                    method, path, installation_id, headers, timeout, kwargs
+                )
+            span.set_attribute("http_status", response.status_code)
+            return response
+
+    def _send(
+        self,
+        method: str,
+        path: str,
+        installation_id: Optional[int],
+        headers: dict,
+        timeout: Optional[Timeout],
+        kwargs: dict,
+    ) -> requests.Response:
+        """Send through the rate limit scheduler, backing off when limited"""
+        endpoint = endpoint_template(path)
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire(installation_id, method)
+            if waited >= 0.001:
+                tracing.current_span().set_attribute(
+                    "rate_limit_wait_ms", round(waited * 1000, 1)
+                )
+            try:
+                response = self.session(installation_id).request(
+                    method,
+                    self.url(path),
+                    headers=headers,
+                    timeout=timeout or self.timeout,
+                    **kwargs,
+                )
+            except requests.RequestException:
+                metrics.GITHUB_REQUESTS.labels(method, endpoint, "error").inc()
+                raise
+            metrics.GITHUB_REQUESTS.labels(
+                method, endpoint, str(response.status_code)
+            ).inc()
+            self.rate_limiter.update(installation_id, response)
+            if not is_rate_limited(response) or attempt >= self.rate_limit_retries:
+                return response
+
+            delay = self.rate_limiter.backoff(installation_id, response, attempt)
+            attempt += 1
+            print(
+                f"⏳ GitHub rate limit on {method} {path} ({response.status_code}), "
+                f"retrying in {delay:.1f}s"
+            )
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def paginate(self, path: str, per_page: int = 100, **kwargs) -> Iterator[dict]:
+        """Yield every item of a list endpoint, following ``Link: rel="next"``"""
+        params = dict(kwargs.pop("params", None) or {}, per_page=per_page)
+        url = path
+        while url:
+            response = self.get(url, params=params, **kwargs)
+            response.raise_for_status()
+            yield from response.json()
+            # The next link already carries the query string
+            url = response.links.get("next", {}).get("url")
+            params = None
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class AsyncGitHubClient:
+    """
+    ``GitHubClient`` for coroutines, on one pooled ``httpx.AsyncClient``.
+    Must be created and used inside a single event loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_API_URL,
+        pool_size: int = 100,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        max_retries: int = 3,
+        rate_limiter: Optional[RateLimitScheduler] = None,
+        rate_limit_retries: int = 3,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or RateLimitScheduler()
+        self.rate_limit_retries = rate_limit_retries
+        self._client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            # The client's own ``limits`` are ignored once a transport is
+            # given, so the pool is sized on the transport.
+            transport=httpx.AsyncHTTPTransport(
+                # Connection failures only; 5xx retries are handled below
+                retries=max_retries,
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                ),
+            ),
+        )
+
+    def url(self, path: str) -> str:
+        return resolve_url(self.base_url, path)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        installation_id: Optional[int] = None,
+        token: Optional[str] = None,
+        accept: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """Same contract as ``GitHubClient.request``"""
+        from github.utils import installation_tokens
+
+        headers = kwargs.pop("headers", None) or {}
+        if accept:
+            headers["Accept"] = accept
+
+        auth_token = token
+        if auth_token is None and installation_id is not None:
+            # Refreshing takes a lock and a blocking request; it happens
+            # about once an hour per installation, so it runs in a thread.
+            auth_token = installation_tokens.cached_token(
+                installation_id
+            ) or await asyncio.to_thread(
+                tracing.bind(installation_tokens.get_token), installation_id
+            )
+        if auth_token:
+            headers["Authorization"] = f"Bearer {auth_token}"
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        with tracing.span("github.request", method=method, path=path) as span:
+            response = await self._send(method, path, installation_id, headers, kwargs)
+
+            if response.status_code == 401 and token is None and installation_id:
+                installation_tokens.invalidate(installation_id)
+                fresh = await asyncio.to_thread(
+                    tracing.bind(installation_tokens.get_token), installation_id
+                )
+                headers["Authorization"] = f"Bearer {fresh}"
+                response = await self._send(
+                    method, path, installation_id, headers, kwargs
+                )
+            span.set_attribute("http_status", response.status_code)
+            return response
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        installation_id: Optional[int],
+        headers: dict,
+        kwargs: dict,
+    ) -> httpx.Response:
+        endpoint = endpoint_template(path)
+        rate_limited = 0
+        server_errors = 0
+        while True:
+            waited = await self.rate_limiter.aacquire(installation_id, method)
+            if waited >= 0.001:
+                tracing.current_span().set_attribute(
+                    "rate_limit_wait_ms", round(waited * 1000, 1)
+                )
+            try:
+                response = await self._client.request(
+                    method, self.url(path), headers=headers, **kwargs
+                )
+            except httpx.HTTPError:
+                metrics.GITHUB_REQUESTS.labels(method, endpoint, "error").inc()
+                raise
+            metrics.GITHUB_REQUESTS.labels(
+                method, endpoint, str(response.status_code)
+            ).inc()
+            self.rate_limiter.update(installation_id, response)
+
+            if is_rate_limited(response) and rate_limited < self.rate_limit_retries:
+                delay = self.rate_limiter.backoff(
+                    installation_id, response, rate_limited
+                )
+                rate_limited += 1
+                print(
+                    f"⏳ GitHub rate limit on {method} {path} ({response.status_code}), "
+                    f"retrying in {delay:.1f}s"
+                )
+                continue
+
+            # Like the sync client, only idempotent requests are retried on 5xx
+            if (
+                response.status_code in RETRY_STATUSES
+                and method.upper() in ("GET", "HEAD")
+                and server_errors < self.max_retries
+            ):
+                await asyncio.sleep(0.5 * 2**server_errors)
+                server_errors += 1
+                continue
+            return response
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def paginate(
+        self, path: str, per_page: int = 100, **kwargs
+    ) -> AsyncIterator[dict]:
+        """Yield every item of a list endpoint, following ``Link: rel="next"``"""
+        params = dict(kwargs.pop("params", None) or {}, per_page=per_page)
+        url = path
+        while url:
+            response = await self.get(url, params=params, **kwargs)
+            response.raise_for_status()
+            for item in response.json():
+                yield item
+            url = response.links.get("next", {}).get("url")
+            params = None
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+@lru_cache(maxsize=1)
+def get_rate_limiter() -> RateLimitScheduler:
+    """Process-wide scheduler shared by the sync and async clients"""
+    return RateLimitScheduler(
+        write_interval=settings.GITHUB_WRITE_INTERVAL,
+        reserve=settings.GITHUB_RATE_LIMIT_RESERVE,
+        max_wait=settings.GITHUB_RATE_LIMIT_MAX_WAIT,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_github_client() -> GitHubClient:
+    """Process-wide client configured from settings"""
+    return GitHubClient(
+        base_url=settings.GITHUB_API_URL,
+        pool_size=settings.GITHUB_POOL_SIZE,
+        connect_timeout=settings.GITHUB_CONNECT_TIMEOUT,
+        read_timeout=settings.GITHUB_READ_TIMEOUT,
+        max_retries=settings.GITHUB_MAX_RETRIES,
+        rate_limiter=get_rate_limiter(),
+        rate_limit_retries=settings.GITHUB_RATE_LIMIT_RETRIES,
+    )
+
+
+_async_clients: Dict[int, AsyncGitHubClient] = {}
+
+
+def get_async_github_client() -> AsyncGitHubClient:
+    """Client for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(id(loop))
+    if client is None:
+        client = AsyncGitHubClient(
+            base_url=settings.GITHUB_API_URL,
+            pool_size=settings.GITHUB_ASYNC_POOL_SIZE,
+            connect_timeout=settings.GITHUB_CONNECT_TIMEOUT,
+            read_timeout=settings.GITHUB_READ_TIMEOUT,
+            max_retries=settings.GITHUB_MAX_RETRIES,
+            rate_limiter=get_rate_limiter(),
+            rate_limit_retries=settings.GITHUB_RATE_LIMIT_RETRIES,
+        )
+        _async_clients[id(loop)] = client
+    return client
+
+
+async def close_async_github_client() -> None:
+    """Close the running loop's client; call before the loop shuts down"""
+    client = _async_clients.pop(id(asyncio.get_running_loop()), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,92 @@
+"""
+Index of review comments the bot already left on a pull request.
+
+Used by the posting stage to drop findings that would duplicate an
+existing comment on the same path and line.
+"""
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Set, Tuple
+
+from core import metrics
+from github.types import PullRequestEvent, ReviewComment
+from testergpt.settings import settings
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def body_hash(body: str) -> str:
+    """Hash of a comment body ignoring case and whitespace differences"""
+    normalized = _WHITESPACE.sub(" ", body).strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def is_bot_comment(comment: ReviewComment) -> bool:
+    if settings.GITHUB_BOT_LOGIN:
+        return comment.user.login == settings.GITHUB_BOT_LOGIN
+    return comment.user.type == "Bot"
+
+
+class CommentIndex:
+    """Set of (path, line, body hash) keys for existing bot comments"""
+
+    def __init__(self):
+        self._keys: Set[Tuple[str, int, str]] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_comments(cls, comments: Iterable[ReviewComment]) -> "CommentIndex":
+        index = cls()
+        for comment in comments:
+            if not is_bot_comment(comment):
+                continue
+            # ``line`` is None once the comment is outdated by a later push
+            line = comment.line or comment.original_line
+            if line is not None:
+                index.add(comment.path, line, comment.body)
+        return index
+
+    def add(self, path: str, line: int, body: str) -> None:
+        with self._lock:
+            self._keys.add((path, line, body_hash(body)))
+
+    def contains(self, path: str, line: int, body: str) -> bool:
+        return (path, line, body_hash(body)) in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class CommentIndexCache:
+    """Bounded LRU of comment indexes keyed by (repository, PR, head SHA)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.stats = metrics.CacheStats("comment_index")
+        self._items: "OrderedDict[Tuple[str, int, str], CommentIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int, str]) -> Optional[CommentIndex]:
+        with self._lock:
+            index = self._items.get(key)
+            if index is not None:
+                self._items.move_to_end(key)
+        self.stats.record(index is not None)
+        return index
+
+    def put(self, key: Tuple[str, int, str], index: CommentIndex) -> None:
+        with self._lock:
+            self._items[key] = index
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+comment_index_cache = CommentIndexCache(maxsize=settings.DIFF_CACHE_SIZE)
+
+
+def comment_index_key(pr: PullRequestEvent) -> Tuple[str, int, str]:
+    return (pr.repository.full_name, pr.number, pr.pull_request.head.sha)
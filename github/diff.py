@@ -0,0 +1,129 @@
+"""
+Parsed pull request diffs shared by every stage of a review.
+
+A ``PRDiff`` is built once per head SHA and kept in a small LRU so the
+review and comment posting stages never download or parse the same diff
+twice.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Callable, Iterable, Iterator, Optional
+
+from unidiff import PatchSet
+from unidiff.patch import Hunk, PatchedFile
+
+from core import metrics, tracing
+from github.positions import DiffPositionIndex
+from testergpt.settings import settings
+
+LINE_NUMBER_WIDTH = 6
+
+
+@dataclass
+class PRDiff:
+    """Raw diff text plus everything derived from it, computed lazily"""
+
+    key: str
+    raw: str
+
+    @cached_property
+    def patch(self) -> PatchSet:
+        with tracing.span("diff.parse", diff_bytes=len(self.raw)) as span:
+            patch = PatchSet(self.raw)
+            span.set_attribute("files", len(patch))
+            return patch
+
+    @cached_property
+    def rendered(self) -> str:
+        """Diff rendered as LLM input, see ``render_diff``"""
+        return render_diff(self.patch)
+
+    def iter_rendered(self) -> Iterator[str]:
+        """Stream the LLM input line by line without building the whole string"""
+        return iter_rendered_lines(self.patch)
+
+    @cached_property
+    def position_index(self) -> DiffPositionIndex:
+        """Path and line lookup for review comment anchors"""
+        return DiffPositionIndex.from_patch(self.patch)
+
+
+def iter_rendered_lines(patch: Iterable[PatchedFile]) -> Iterator[str]:
+    """
+    Yield the LLM rendering of a diff one line at a time.
+
+    Added and context lines are prefixed with their line number in the new
+    file so the model never has to count from hunk headers; removed lines
+    get a blank number column.
+
+        File: src/app.py
+        @@ -1,3 +1,4 @@
+            1  : import os
+               -: import sys
+            2 +: import sys, json
+    """
+    for patched_file in patch:
+        yield f"File: {patched_file.path}\n"
+        for hunk in patched_file:
+            yield from iter_hunk_lines(hunk)
+
+
+def iter_hunk_lines(hunk: Hunk) -> Iterator[str]:
+    """Rendering of a single hunk, header included"""
+    blank = " " * LINE_NUMBER_WIDTH
+    yield (
+        f"@@ -{hunk.source_start},{hunk.source_length} "
+        f"+{hunk.target_start},{hunk.target_length} @@\n"
+    )
+    for line in hunk:
+        number = (
+            f"{line.target_line_no:>{LINE_NUMBER_WIDTH}}"
+            if line.target_line_no
+            else blank
+        )
+        value = line.value.rstrip("\r\n")
+        yield f"{number} {line.line_type}: {value}\n"
+
+
+def render_diff(patch: Iterable[PatchedFile]) -> str:
+    """Render a whole diff in linear time"""
+    return "".join(iter_rendered_lines(patch))
+
+
+class DiffCache:
+    """Thread-safe bounded LRU of ``PRDiff`` objects"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.stats = metrics.CacheStats("diff")
+        self._items: "OrderedDict[str, PRDiff]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[PRDiff]:
+        with self._lock:
+            diff = self._items.get(key)
+            if diff is not None:
+                self._items.move_to_end(key)
+        self.stats.record(diff is not None)
+        return diff
+
+    def put(self, diff: PRDiff) -> None:
+        with self._lock:
+            self._items[diff.key] = diff
+            self._items.move_to_end(diff.key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_load(self, key: str, loader: Callable[[], str]) -> PRDiff:
+        """Return the cached diff for ``key`` or build it from ``loader()``"""
+        diff = self.get(key)
+        if diff is None:
+            diff = PRDiff(key=key, raw=loader())
+            self.put(diff)
+        return diff
+
+
+diff_cache = DiffCache(maxsize=settings.DIFF_CACHE_SIZE)
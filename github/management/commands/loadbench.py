@@ -0,0 +1,517 @@
+"""
+Replay webhook deliveries against the app with api.github.com and Gemini
+replaced by local stub servers, and report latency, external calls per
+review and peak memory.
+
+    python manage.py loadbench --prs 50 --pushes 2 --rate 20
+    python manage.py loadbench --deliveries recorded.jsonl --output bench.json
+
+Deliveries are sent to the webhook view in-process and reviews run on
+worker threads like ``review_worker``, or as tasks on one event loop like
+``review_worker --async`` with ``--async``, against a throwaway test
+database and an in-memory review cache. Record real deliveries with
+WEBHOOK_RECORD_FILE.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, NamedTuple, Optional
+
+from asgiref.sync import sync_to_async
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.urls import reverse
+
+from benchmarks.payloads import pull_request_event_body
+from benchmarks.stubs import start_stubs
+from core import llm_client
+from core.llm_gateway import llm_gateway
+from core.review_cache import ReviewCache
+from github import client as github_client
+from github import utils as github_utils
+from github.models import ReviewJob
+from github.tasks import arun_review_job, claim_next_job, run_review_job
+from testergpt.settings import settings
+
+FINISHED_STATUSES = (
+    ReviewJob.STATUS_DONE,
+    ReviewJob.STATUS_FAILED,
+    ReviewJob.STATUS_SUPERSEDED,
+)
+
+
+class Delivery(NamedTuple):
+    event: str
+    delivery: str
+    body: bytes
+
+
+def load_deliveries(path: str) -> List[Delivery]:
+    """Deliveries recorded with WEBHOOK_RECORD_FILE, in their recorded order"""
+    deliveries = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "body" in record:
+                body = record["body"].encode("utf-8")
+            else:
+                body = json.dumps(record["payload"]).encode("utf-8")
+            deliveries.append(
+                Delivery(
+                    record.get("event", "pull_request"),
+                    record.get("delivery", f"replay-{number}"),
+                    body,
+                )
+            )
+    return deliveries
+
+
+def synthesize_deliveries(prs: int, pushes: int, installations: int) -> List[Delivery]:
+    """
+    One ``opened`` delivery per PR followed by ``pushes`` synchronize
+    deliveries each, interleaved across PRs the way concurrent activity
+    arrives.
+    """
+
+    def sha(pr: int, push: int) -> str:
+        return hashlib.sha1(f"{pr}-{push}".encode()).hexdigest()
+
+    deliveries = []
+    for push in range(pushes + 1):
+        for pr in range(1, prs + 1):
+            body = pull_request_event_body(
+                action="opened" if push == 0 else "synchronize",
+                number=pr,
+                head_sha=sha(pr, push),
+                before=sha(pr, push - 1) if push else None,
+                installation_id=1000 + pr % installations,
+            )
+            deliveries.append(Delivery("pull_request", f"bench-{pr}-{push}", body))
+    return deliveries
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Command(BaseCommand):
+    help = "Replay webhook deliveries against stubbed GitHub and Gemini servers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--deliveries",
+            help="JSON Lines file of recorded deliveries (WEBHOOK_RECORD_FILE)",
+        )
+        parser.add_argument(
+            "--prs",
+            type=int,
+            default=20,
+            help="Synthetic PRs when no --deliveries file is given",
+        )
+        parser.add_argument(
+            "--pushes",
+            type=int,
+            default=1,
+            help="Synchronize pushes per synthetic PR",
+        )
+        parser.add_argument(
+            "--installations",
+            type=int,
+            default=4,
+            help="GitHub App installations the synthetic PRs are spread over",
+        )
+        parser.add_argument(
+            "--rate", type=float, default=10.0, help="Deliveries sent per second"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.REVIEW_WORKER_CONCURRENCY,
+            help="Worker threads running reviews, or review tasks with --async",
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="use_async",
+            help="Run reviews as tasks on one event loop, like review_worker --async",
+        )
+        parser.add_argument(
+            "--github-latency",
+            type=float,
+            default=0.05,
+            help="Mean GitHub stub latency in seconds",
+        )
+        parser.add_argument(
+            "--github-error-rate",
+            type=float,
+            default=0.0,
+            help="Share of GitHub stub requests answered with 502",
+        )
+        parser.add_argument(
+            "--llm-latency",
+            type=float,
+            default=1.0,
+            help="Mean Gemini stub latency in seconds",
+        )
+        parser.add_argument(
+            "--llm-error-rate",
+            type=float,
+            default=0.0,
+            help="Share of Gemini stub requests answered with 503",
+        )
+        parser.add_argument(
+            "--diff-files", type=int, default=3, help="Files in each stub diff"
+        )
+        parser.add_argument(
+            "--diff-lines", type=int, default=40, help="Added lines per stub diff file"
+        )
+        parser.add_argument(
+            "--sync-debounce",
+            type=float,
+            help="Override REVIEW_SYNC_DEBOUNCE_SECONDS for the run",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=600.0,
+            help="Seconds to wait for the queue to drain after the last delivery",
+        )
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["deliveries"]:
+            deliveries = load_deliveries(options["deliveries"])
+        else:
+            deliveries = synthesize_deliveries(
+                options["prs"], options["pushes"], max(1, options["installations"])
+            )
+        if not deliveries:
+            raise CommandError("No deliveries to replay")
+        if options["rate"] <= 0:
+            raise CommandError("--rate must be positive")
+
+        github, gemini = start_stubs(
+            github_latency=options["github_latency"],
+            github_error_rate=options["github_error_rate"],
+            llm_latency=options["llm_latency"],
+            llm_error_rate=options["llm_error_rate"],
+            diff_files=options["diff_files"],
+            diff_lines=options["diff_lines"],
+        )
+        self._configure(github.url, gemini.url, options["sync_debounce"])
+        old_db_name = self._create_test_db()
+        # Every run starts cold and never touches REVIEW_CACHE_DB
+        review_cache = llm_client.review_cache
+        llm_client.review_cache = ReviewCache(
+            maxsize=settings.REVIEW_CACHE_SIZE,
+            prompt_version=llm_client.PROMPT_VERSION,
+            db_path=None,
+        )
+
+        self.stdout.write(
+            f"🚀 Replaying {len(deliveries)} deliveries at {options['rate']}/s "
+            f"with {options['concurrency']} "
+            f"{'async tasks' if options['use_async'] else 'workers'} "
+            f"(GitHub {github.url}, Gemini {gemini.url})"
+        )
+        try:
+            # Pipeline output is only shown with -v 2
+            quiet = options["verbosity"] < 2
+            with open(os.devnull, "w") as devnull, (
+                contextlib.redirect_stdout(devnull)
+                if quiet
+                else contextlib.nullcontext()
+            ):
+                results = self._run(deliveries, options)
+            results.update(
+                github_calls=dict(github.calls),
+                github_errors=github.errors,
+                llm_calls=dict(gemini.calls),
+                llm_errors=gemini.errors,
+                llm_limits=llm_gateway.limits()._asdict(),
+                peak_rss_bytes=peak_rss_bytes(),
+            )
+            reviews = results["jobs"].get(ReviewJob.STATUS_DONE, 0)
+            results["github_calls_per_review"] = (
+                round(github.total_calls() / reviews, 2) if reviews else None
+            )
+            results["llm_calls_per_review"] = (
+                round(gemini.total_calls() / reviews, 2) if reviews else None
+            )
+        finally:
+            github.stop()
+            gemini.stop()
+            llm_client.review_cache = review_cache
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+
+        self._report(results)
+        if options["output"]:
+            results["options"] = {
+                key: options[key]
+                for key in (
+                    "deliveries", "prs", "pushes", "installations", "rate",
+                    "concurrency", "use_async", "github_latency", "github_error_rate",
+                    "llm_latency", "llm_error_rate", "diff_files", "diff_lines",
+                    "sync_debounce",
+                )
+            }  # fmt: skip
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def _configure(
+        self, github_url: str, gemini_url: str, sync_debounce: Optional[float]
+    ) -> None:
+        """Point the GitHub and LLM clients at the stubs"""
+        settings.GITHUB_API_URL = github_url
+        settings.LLM_API_ENDPOINT = gemini_url
+        settings.GPT_API_KEY = "loadbench"
+        settings.WEBHOOK_RECORD_FILE = ""
+        if sync_debounce is not None:
+            settings.REVIEW_SYNC_DEBOUNCE_SECONDS = sync_debounce
+
+        # Installation tokens are exchanged for real, signed with a throwaway key
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        settings.GITHUB_APP_ID = settings.GITHUB_APP_ID or 1
+        settings.GITHUB_PRIVATE_KEY = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode("utf-8")
+        github_utils._load_private_key.cache_clear()
+        github_client.get_github_client.cache_clear()
+
+    def _create_test_db(self) -> str:
+        """Run against a fresh copy of the schema, never the real database"""
+        old_name = connection.settings_dict["NAME"]
+        if connection.vendor == "sqlite" and not connection.settings_dict["TEST"].get(
+            "NAME"
+        ):
+            # The default in-memory test database cannot take writes from
+            # many threads at once
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                tempfile.mkdtemp(prefix="loadbench-"), "loadbench.sqlite3"
+            )
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        return old_name
+
+    def _run(self, deliveries: List[Delivery], options) -> dict:
+        sent = threading.Event()
+        worker = threading.Thread(
+            target=self._work_async if options["use_async"] else self._work,
+            args=(options["concurrency"], sent),
+            daemon=True,
+        )
+        worker.start()
+
+        webhook_latencies: List[float] = []
+        statuses: dict = {}
+        lock = threading.Lock()
+        local = threading.local()
+        url = reverse("github_webhook")
+
+        def send(delivery: Delivery) -> None:
+            if not hasattr(local, "client"):
+                local.client = Client()
+            signature = hmac.new(
+                settings.GITHUB_SECRET.encode("utf-8"), delivery.body, hashlib.sha256
+            ).hexdigest()
+            started = time.perf_counter()
+            try:
+                response = local.client.post(
+                    url,
+                    data=delivery.body,
+                    content_type="application/json",
+                    headers={
+                        "X-GitHub-Event": delivery.event,
+                        "X-GitHub-Delivery": delivery.delivery,
+                        "X-Hub-Signature-256": f"sha256={signature}",
+                    },
+                )
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            finally:
+                close_old_connections()
+            with lock:
+                webhook_latencies.append(time.perf_counter() - started)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        # Open loop: deliveries go out on schedule however slow the app is
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=32, thread_name_prefix="sender") as pool:
+            for index, delivery in enumerate(deliveries):
+                delay = started + index / options["rate"] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(send, delivery)
+        send_seconds = time.perf_counter() - started
+        sent.set()
+        worker.join(options["timeout"])
+        if worker.is_alive():
+            self.stderr.write("⚠️ Queue did not drain before --timeout")
+        wall_seconds = time.perf_counter() - started
+
+        jobs = list(
+            ReviewJob.objects.values(
+                "status", "created_at", "started_at", "finished_at"
+            )
+        )
+        counts: dict = {}
+        for job in jobs:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        finished = [job for job in jobs if job["status"] == ReviewJob.STATUS_DONE]
+        end_to_end = [
+            (job["finished_at"] - job["created_at"]).total_seconds() for job in finished
+        ]
+        queue_wait = [
+            (job["started_at"] - job["created_at"]).total_seconds()
+            for job in finished
+            if job["started_at"]
+        ]
+        close_old_connections()
+
+        return {
+            "deliveries": len(deliveries),
+            "send_seconds": round(send_seconds, 2),
+            "wall_seconds": round(wall_seconds, 2),
+            "reviews_per_second": round(len(finished) / wall_seconds, 2),
+            "webhook_statuses": statuses,
+            "jobs": counts,
+            "webhook_latency": _summary(webhook_latencies),
+            "end_to_end_latency": _summary(end_to_end),
+            "queue_wait": _summary(queue_wait),
+        }
+
+    def _work(self, concurrency: int, sent: threading.Event) -> None:
+        """``review_worker``'s loop, until every delivery is in and handled"""
+
+        def run(job):
+            try:
+                run_review_job(job)
+            finally:
+                close_old_connections()
+
+        in_flight = set()
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="review"
+        ) as executor:
+            while True:
+                while len(in_flight) < concurrency:
+                    job = claim_next_job()
+                    if job is None:
+                        break
+                    in_flight.add(executor.submit(run, job))
+                if in_flight:
+                    _, in_flight = wait(
+                        in_flight, timeout=0.1, return_when=FIRST_COMPLETED
+                    )
+                    continue
+                if (
+                    sent.is_set()
+                    and not ReviewJob.objects.exclude(
+                        status__in=FINISHED_STATUSES
+                    ).exists()
+                ):
+                    break
+                time.sleep(0.05)
+        close_old_connections()
+
+    def _work_async(self, concurrency: int, sent: threading.Event) -> None:
+        """``review_worker --async``'s loop, until every delivery is handled"""
+
+        def unfinished() -> bool:
+            return ReviewJob.objects.exclude(status__in=FINISHED_STATUSES).exists()
+
+        async def work():
+            claim = sync_to_async(claim_next_job)
+            in_flight = set()
+            try:
+                while True:
+                    while len(in_flight) < concurrency:
+                        job = await claim()
+                        if job is None:
+                            break
+                        in_flight.add(asyncio.create_task(arun_review_job(job)))
+                    if in_flight:
+                        _, in_flight = await asyncio.wait(
+                            in_flight, timeout=0.1, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        continue
+                    if sent.is_set() and not await sync_to_async(unfinished)():
+                        break
+                    await asyncio.sleep(0.05)
+            finally:
+                await github_client.close_async_github_client()
+
+        asyncio.run(work())
+        close_old_connections()
+
+    def _report(self, results: dict) -> None:
+        self.stdout.write(
+            f"\nDeliveries: {results['deliveries']} in {results['send_seconds']}s, "
+            f"drained after {results['wall_seconds']}s "
+            f"({results['reviews_per_second']} reviews/s)"
+        )
+        self.stdout.write(f"Webhook responses: {results['webhook_statuses']}")
+        self.stdout.write(f"Jobs: {results['jobs']}")
+        for name in ("webhook_latency", "end_to_end_latency", "queue_wait"):
+            summary = results[name]
+            if summary["count"]:
+                self.stdout.write(
+                    f"{name.replace('_', ' ').capitalize():<20} "
+                    f"p50 {summary['p50'] * 1000:>9.1f} ms   "
+                    f"p95 {summary['p95'] * 1000:>9.1f} ms   "
+                    f"p99 {summary['p99'] * 1000:>9.1f} ms"
+                )
+        self.stdout.write(
+            f"GitHub calls per review: {results['github_calls_per_review']} "
+            f"{results['github_calls']} ({results['github_errors']} injected errors)"
+        )
+        self.stdout.write(
+            f"LLM calls per review: {results['llm_calls_per_review']} "
+            f"{results['llm_calls']} ({results['llm_errors']} injected errors)"
+        )
+        self.stdout.write(f"LLM gateway: {results['llm_limits']}")
+        self.stdout.write(
+            f"Peak RSS: {results['peak_rss_bytes'] / (1024 * 1024):.1f} MiB"
+        )
+
+
+def _summary(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
@@ -0,0 +1,145 @@
+"""
+Run queued pull request reviews.
+
+    python manage.py review_worker --concurrency 8
+    python manage.py review_worker --async --concurrency 200
+"""
+
+import asyncio
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.llm_client import llm_registry
+from core.llm_gateway import llm_gateway
+from github.client import close_async_github_client
+from github.tasks import (
+    arun_review_job,
+    claim_next_job,
+    requeue_stale_jobs,
+    run_review_job,
+)
+from testergpt.settings import settings
+
+
+def _run_in_thread(job):
+    try:
+        run_review_job(job)
+    finally:
+        # Each worker thread owns its own DB connection
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Process queued pull request review jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.REVIEW_WORKER_CONCURRENCY,
+            help="Number of reviews to run in parallel",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.REVIEW_WORKER_POLL_INTERVAL,
+            help="Seconds to sleep when the queue is empty",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once the queue is drained instead of polling forever",
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="use_async",
+            help="Run reviews as tasks on one event loop instead of threads",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options["concurrency"])
+        poll_interval = options["poll_interval"]
+        burst = options["burst"]
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale review jobs")
+
+        llm_registry.warm_up([settings.LLM_FAST_MODEL, settings.LLM_MODEL])
+
+        self.stdout.write(
+            f"🚀 Review worker started (concurrency={concurrency}, "
+            f"async={options['use_async']}, "
+            f"LLM limits {llm_gateway.limits()._asdict()})"
+        )
+        if options["use_async"]:
+            try:
+                asyncio.run(self._run_async(concurrency, poll_interval, burst))
+            except KeyboardInterrupt:
+                self.stdout.write("Review worker interrupted")
+            self.stdout.write("Review worker stopped")
+            return
+
+        in_flight = set()
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="review"
+        ) as executor:
+            try:
+                while True:
+                    while len(in_flight) < concurrency:
+                        job = claim_next_job()
+                        if job is None:
+                            break
+                        in_flight.add(executor.submit(_run_in_thread, job))
+
+                    if in_flight:
+                        done, in_flight = wait(
+                            in_flight,
+                            timeout=poll_interval,
+                            return_when=FIRST_COMPLETED,
+                        )
+                        continue
+
+                    if burst:
+                        break
+                    close_old_connections()
+                    time.sleep(poll_interval)
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping review worker, waiting for in-flight jobs")
+                wait(in_flight)
+
+        self.stdout.write("Review worker stopped")
+
+    async def _run_async(self, concurrency, poll_interval, burst):
+        """Keep up to ``concurrency`` review tasks in flight on this loop"""
+        claim = sync_to_async(claim_next_job)
+        in_flight = set()
+        try:
+            while True:
+                while len(in_flight) < concurrency:
+                    job = await claim()
+                    if job is None:
+                        break
+                    in_flight.add(asyncio.create_task(arun_review_job(job)))
+
+                if in_flight:
+                    done, in_flight = await asyncio.wait(
+                        in_flight,
+                        timeout=poll_interval,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    continue
+
+                if burst:
+                    break
+                await asyncio.sleep(poll_interval)
+        finally:
+            if in_flight:
+                self.stdout.write("Stopping review worker, waiting for in-flight jobs")
+                await asyncio.wait(in_flight)
+            await close_async_github_client()
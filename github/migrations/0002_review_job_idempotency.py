@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("github", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reviewjob",
+            name="delivery_id",
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="reviewjob",
+            index=models.Index(
+                fields=["repository", "pr_number", "head_sha"],
+                name="github_revi_reposit_826228_idx",
+            ),
+        ),
+    ]
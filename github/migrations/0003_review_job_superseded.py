@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("github", "0002_review_job_idempotency"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reviewjob",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                    ("superseded", "Superseded"),
+                ],
+                db_index=True,
+                default="pending",
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("github", "0003_review_job_superseded"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reviewjob",
+            name="traceparent",
+            field=models.CharField(blank=True, default="", max_length=55),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("github", "0004_review_job_traceparent"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="reviewjob",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("delivery_id__in", ["", "unknown"]), _negated=True),
+                fields=("delivery_id",),
+                name="unique_review_job_delivery",
+            ),
+        ),
+    ]
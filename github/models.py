@@ -1,3 +1,66 @@
 from django.db import models
 
-# Create your models here.
+
+class ReviewJob(models.Model):
+    """
+    A pull request review queued by the webhook and executed by the
+    ``review_worker`` management command.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    # Replaced by a job for a newer head of the same pull request
+    STATUS_SUPERSEDED = "superseded"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+        (STATUS_SUPERSEDED, "Superseded"),
+    ]
+
+    delivery_id = models.CharField(max_length=64, db_index=True)
+    event = models.CharField(max_length=64)
+    action = models.CharField(max_length=64)
+    repository = models.CharField(max_length=255)
+    pr_number = models.PositiveIntegerField()
+    head_sha = models.CharField(max_length=64)
+    payload = models.JSONField()
+
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+
+    # W3C traceparent of the webhook span, continued by the worker
+    traceparent = models.CharField(max_length=55, blank=True, default="")
+
+    available_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["available_at", "id"]
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+            # Idempotency lookups for redeliveries and repeated head SHAs
+            models.Index(fields=["repository", "pr_number", "head_sha"]),
+        ]
+        constraints = [
+            # Concurrent redeliveries cannot both queue a review; deliveries
+            # without a GitHub delivery id are exempt
+            models.UniqueConstraint(
+                fields=["delivery_id"],
+                condition=~models.Q(delivery_id__in=["", "unknown"]),
+                name="unique_review_job_delivery",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"ReviewJob({self.pk}, {self.repository}#{self.pr_number}, {self.status})"
+        )
@@ -0,0 +1,156 @@
+"""
+Lookup of review comment anchors for the files and lines of a diff.
+
+Paths reported by the model are matched against the diff's paths through
+a trie of reversed path components, so "app.py", "src/app.py" and
+"repo/src/app.py" all resolve in time proportional to the path depth
+rather than the number of files in the diff.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from unidiff import PatchSet
+
+from core.review_cache import parse_line_range
+
+
+class AmbiguousPathError(LookupError):
+    """A path suffix matches more than one file in the diff"""
+
+    def __init__(self, path: str, candidates: List[str]):
+        self.path = path
+        self.candidates = candidates
+        super().__init__(f"'{path}' matches several files: {', '.join(candidates)}")
+
+
+@dataclass
+class CommentAnchor:
+    """Where a review comment goes; ``start_line`` is set for multi-line comments"""
+
+    path: str
+    line: int
+    position: int
+    start_line: Optional[int] = None
+
+    def as_review_comment(self, body: str) -> dict:
+        comment = {"path": self.path, "line": self.line, "side": "RIGHT", "body": body}
+        if self.start_line is not None:
+            comment["start_line"] = self.start_line
+            comment["start_side"] = "RIGHT"
+        return comment
+
+
+@dataclass
+class _TrieNode:
+    children: Dict[str, "_TrieNode"] = field(default_factory=dict)
+    # Diff path that ends exactly at this node
+    terminal: Optional[str] = None
+    # Number of diff paths below this node and one of them
+    count: int = 0
+    example: Optional[str] = None
+
+
+def _components(path: str) -> List[str]:
+    path = path.strip().lstrip("/")
+    for prefix in ("a/", "b/", "./"):
+        if path.startswith(prefix):
+            path = path[len(prefix) :]
+            break
+    return [part for part in path.split("/") if part]
+
+
+class DiffPositionIndex:
+    """
+    Per-file maps of new-file line number to (diff position, hunk number),
+    plus a reversed-component trie over the file paths.
+    """
+
+    def __init__(self, lines: Dict[str, Dict[int, Tuple[int, int]]]):
+        self.lines = lines
+        self._root = _TrieNode()
+        for path in lines:
+            node = self._root
+            for part in reversed(_components(path)):
+                node = node.children.setdefault(part, _TrieNode())
+                node.count += 1
+                node.example = node.example or path
+            node.terminal = path
+
+    @classmethod
+    def from_patch(cls, patch: PatchSet) -> "DiffPositionIndex":
+        lines: Dict[str, Dict[int, Tuple[int, int]]] = {}
+        for patched_file in patch:
+            file_path = patched_file.path
+            if file_path.startswith("b/"):
+                file_path = file_path[2:]  # Remove 'b/' prefix
+
+            file_lines = lines.setdefault(file_path, {})
+            position = 0
+            for hunk_number, hunk in enumerate(patched_file):
+                # Every hunk header after the first occupies a position too
+                if hunk_number:
+                    position += 1
+                for line in hunk:
+                    position += 1
+                    if line.line_type in ("+", " ") and line.target_line_no:
+                        file_lines[line.target_line_no] = (position, hunk_number)
+        return cls(lines)
+
+    def resolve_path(self, path: str) -> Optional[str]:
+        """
+        Return the diff path ``path`` refers to, or None if there is none.
+        Raises ``AmbiguousPathError`` if a suffix matches several files.
+        """
+        if path in self.lines:
+            return path
+
+        node = self._root
+        longest_terminal = None
+        for part in reversed(_components(path)):
+            node = node.children.get(part)
+            if node is None:
+                # ``path`` has extra leading components; the deepest diff path
+                # that is a suffix of it is the match.
+                return longest_terminal
+            if node.terminal is not None:
+                longest_terminal = node.terminal
+
+        if node is self._root:
+            return None
+        if node.terminal is not None or node.count == 1:
+            return node.terminal or node.example
+        raise AmbiguousPathError(path, self._candidates(node))
+
+    def _candidates(self, node: _TrieNode, limit: int = 5) -> List[str]:
+        found: List[str] = []
+        stack = [node]
+        while stack and len(found) < limit:
+            current = stack.pop()
+            if current.terminal is not None:
+                found.append(current.terminal)
+            stack.extend(current.children.values())
+        return found
+
+    def anchor(self, path: str, line_spec: str) -> Optional[CommentAnchor]:
+        """
+        Anchor for a finding at ``line_spec`` ("12" or "12-18"). A range becomes
+        a multi-line comment when both ends are in the same hunk, otherwise
+        the comment goes on whichever end is in the diff.
+        """
+        lines = parse_line_range(line_spec)
+        diff_path = self.resolve_path(path)
+        if lines is None or diff_path is None:
+            return None
+
+        start, end = sorted(lines)
+        file_lines = self.lines[diff_path]
+        first = file_lines.get(start)
+        last = file_lines.get(end)
+        if first and last and start != end and first[1] == last[1]:
+            return CommentAnchor(diff_path, end, last[0], start_line=start)
+        if first:
+            return CommentAnchor(diff_path, start, first[0])
+        if last:
+            return CommentAnchor(diff_path, end, last[0])
+        return None
@@ -0,0 +1,425 @@
+"""
+Posting review findings back to the pull request.
+
+``ReviewPoster`` turns findings into inline review comments and sends them
+as pull request reviews. In batch mode everything goes out in one review
+when the poster is closed; in streaming mode findings are flushed in
+batches by count and age while the model is still generating.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable, List, Optional, Union
+
+from core import tracing
+from core.types import DiffIssue, PRReviewResponse
+from github.client import get_async_github_client, get_github_client
+from github.comment_index import CommentIndex
+from github.diff import PRDiff
+from github.positions import AmbiguousPathError
+from github.service import get_pr_diff, pr_path
+from github.types import PullRequestEvent
+
+
+class ReviewSuperseded(Exception):
+    """A newer push made the head this review is for stale"""
+
+
+class ReviewPoster:
+    """
+    Collects findings and posts them as pull request reviews.
+
+    ``batch_size``/``batch_seconds`` enable streaming: a review is posted as
+    soon as that many inline comments are pending, or the oldest pending one
+    has waited that long. ``close`` posts the summary, the remaining inline
+    comments and every finding that could not be anchored.
+
+    ``add`` only queues a finding; batches are posted from the poster's own
+    thread, so GitHub latency and errors never reach the LLM stream that
+    calls ``add``.
+
+    ``is_stale`` is checked before every post and on every tick of the
+    poster thread; once it returns True nothing more is posted and ``add``
+    and ``checkpoint`` raise ``ReviewSuperseded`` so streaming generation
+    stops.
+    """
+
+    def __init__(
+        self,
+        payload: PullRequestEvent,
+        pr_diff: PRDiff,
+        existing: Union[CommentIndex, "Future[CommentIndex]", None] = None,
+        batch_size: Optional[int] = None,
+        batch_seconds: Optional[float] = None,
+        is_stale: Optional[Callable[[], bool]] = None,
+    ):
+        self.payload = payload
+        self.position_index = pr_diff.position_index
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.is_stale = is_stale
+        self.cancelled = False
+        self._existing = existing
+
+        self._pending: List[DiffIssue] = []
+        self._first_pending_at: Optional[float] = None
+        self.unmapped: List[DiffIssue] = []
+        self.duplicates = 0
+        self.posted_comments = 0
+        self.reviews_posted = 0
+
+        self._lock = threading.Lock()
+        self._post_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._retry_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+        if batch_size or batch_seconds:
+            self._thread = threading.Thread(
+                target=tracing.bind(self._post_batches),
+                name="review-poster",
+                daemon=True,
+            )
+            self._thread.start()
+
+    @property
+    def existing(self) -> Optional[CommentIndex]:
+        """Existing comment index, waiting for it if it is still being fetched"""
+        if isinstance(self._existing, Future):
+            try:
+                self._existing = self._existing.result()
+            except Exception as e:
+                print(f"⚠️ Could not load existing comments, not deduplicating: {e}")
+                self._existing = None
+        return self._existing
+
+    def checkpoint(self) -> None:
+        """Raise ``ReviewSuperseded`` once the review is known to be stale"""
+        if self.cancelled:
+            raise ReviewSuperseded(f"PR #{self.payload.number} has a newer head")
+
+    def add(self, issue: DiffIssue) -> None:
+        self.checkpoint()
+        with self._lock:
+            self._pending.append(issue)
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            full = self.batch_size and len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self) -> None:
+        """
+        Post the pending inline comments as one review. If posting fails
+        they are put back in front of the queue and the error is raised.
+        """
+        with self._post_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._first_pending_at = None
+            comments, inline = self.anchor(pending)
+            if comments and not self._check_stale():
+                try:
+                    self._submit(
+                        f"🤖 TesterGPT found {len(comments)} more issues, review in progress…",
+                        comments,
+                        inline,
+                        [],
+                    )
+                except Exception:
+                    with self._lock:
+                        self._pending[:0] = inline
+                        self._first_pending_at = time.monotonic()
+                    raise
+
+    def stop(self) -> None:
+        """Stop the poster thread without posting anything else"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def close(self, review_response: PRReviewResponse) -> None:
+        """Post the final review with the summary and everything still pending"""
+        self.stop()
+
+        with self._post_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            comments, inline = self.anchor(pending)
+
+            if self.duplicates:
+                print(
+                    f"🔁 Skipped {self.duplicates} findings that are already commented"
+                )
+            if not comments and not self.unmapped and not self.reviews_posted:
+                print("No new findings to post, skipping review")
+                return
+            if self._check_stale():
+                return
+
+            self._submit(
+                _format_review_body(review_response, self.unmapped),
+                comments,
+                inline,
+                self.unmapped,
+                summary=review_response,
+            )
+            print(
+                f"🎯 Posted {self.reviews_posted} reviews with {self.posted_comments} "
+                f"inline comments and {len(self.unmapped)} findings in the body"
+            )
+
+    def _check_stale(self) -> bool:
+        if not self.cancelled and self.is_stale is not None and self.is_stale():
+            print(f"⏭️ PR #{self.payload.number} has a newer head, dropping findings")
+            self.cancelled = True
+        return self.cancelled
+
+    def _post_batches(self) -> None:
+        """
+        Poster thread: flush whenever a batch is full or old enough, and
+        notice a newer head even while the model emits no findings
+        """
+        interval = min(self.batch_seconds or 0.5, 0.5)
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            if self._check_stale():
+                # The stream aborts at its next ``checkpoint``
+                return
+            if not self._batch_due():
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                # The findings stay queued for the next batch or ``close``
+                self._retry_at = time.monotonic() + max(self.batch_seconds or 0, 1.0)
+                print(f"⚠️ Could not post a batch of findings, will retry: {e}")
+
+    def _batch_due(self) -> bool:
+        with self._lock:
+            if not self._pending or time.monotonic() < self._retry_at:
+                return False
+            if self.batch_size and len(self._pending) >= self.batch_size:
+                return True
+            return bool(self.batch_seconds) and (
+                time.monotonic() - self._first_pending_at >= self.batch_seconds
+            )
+
+    def anchor(self, issues: List[DiffIssue]):
+        """Split issues into review comments and body entries, dropping duplicates"""
+        existing = self.existing
+        comments = []
+        inline = []
+        for issue in issues:
+            comment_body = _format_issue_comment(issue)
+
+            # Resolve the file and line(s) against the diff
+            try:
+                anchor = self.position_index.anchor(issue.file, issue.line)
+            except AmbiguousPathError as e:
+                print(f"⚠️ {e}, adding to review body")
+                self.unmapped.append(issue)
+                continue
+            if anchor is None:
+                print(
+                    f"⚠️ Line {issue.line} in file {issue.file} not found in diff, adding to review body"
+                )
+                self.unmapped.append(issue)
+                continue
+
+            if existing is not None and existing.contains(
+                anchor.path, anchor.line, comment_body
+            ):
+                self.duplicates += 1
+                continue
+
+            inline.append(issue)
+            comments.append(anchor.as_review_comment(comment_body))
+        return comments, inline
+
+    def _submit(
+        self,
+        body: str,
+        comments: list,
+        inline: List[DiffIssue],
+        unmapped: List[DiffIssue],
+        summary: Optional[PRReviewResponse] = None,
+    ) -> None:
+        with tracing.span(
+            "github.post_review",
+            comments=len(comments),
+            unmapped=len(unmapped),
+            final=summary is not None,
+        ) as span:
+            response = _create_pr_review(self.payload, body, comments)
+            if response.status_code == 422 and comments:
+                # GitHub rejects the whole review if any anchor is invalid, so
+                # retry once with every finding in the body.
+                print(f"❌ Review rejected ({response.status_code}): {response.text}")
+                print("🔄 Retrying with all findings in the review body")
+                summary = summary or PRReviewResponse(summary="Additional findings.")
+                response = _create_pr_review(
+                    self.payload, _format_review_body(summary, unmapped + inline), []
+                )
+                comments = []
+                span.set_attribute("rejected", True)
+
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code not in (200, 201):
+                print(
+                    f"❌ Failed to post review ({response.status_code}): {response.text}"
+                )
+                response.raise_for_status()
+
+        self.reviews_posted += 1
+        self.posted_comments += len(comments)
+        existing = self.existing
+        if existing is not None:
+            for comment in comments:
+                existing.add(comment["path"], comment["line"], comment["body"])
+
+
+def post_pr_comments(
+    payload: PullRequestEvent,
+    review_response: PRReviewResponse,
+    pr_diff: Optional[PRDiff] = None,
+    existing: Optional[CommentIndex] = None,
+    is_stale: Optional[Callable[[], bool]] = None,
+):
+    """
+    Post every finding as a single pull request review. Issues that map onto
+    the diff become inline comments; the rest are folded into the review body.
+    Positions always come from the full PR diff, which is normally already
+    cached by the review stage. Findings already present in ``existing`` are
+    dropped. Raises ``ReviewSuperseded`` instead of posting if ``is_stale``.
+    """
+    if not review_response.issues:
+        print("No issues found in the diff, skipping comment posting")
+        return
+
+    if not payload or not payload.pull_request:
+        print("Invalid payload data, cannot post comments")
+        return
+
+    try:
+        poster = ReviewPoster(
+            payload, pr_diff or get_pr_diff(payload), existing, is_stale=is_stale
+        )
+        for issue in review_response.issues:
+            poster.add(issue)
+        poster.close(review_response)
+    except Exception as e:
+        print(f"Error posting PR comments: {e}")
+        raise
+    if poster.cancelled:
+        raise ReviewSuperseded(f"PR #{payload.number} has a newer head")
+
+
+async def apost_pr_comments(
+    payload: PullRequestEvent,
+    review_response: PRReviewResponse,
+    pr_diff: PRDiff,
+    existing: Optional[CommentIndex] = None,
+    is_stale: Optional[Callable[[], Awaitable[bool]]] = None,
+):
+    """Async ``post_pr_comments`` for the event-loop worker"""
+    if not review_response.issues:
+        print("No issues found in the diff, skipping comment posting")
+        return
+
+    def anchor():
+        poster = ReviewPoster(payload, pr_diff, existing)
+        return (poster, *poster.anchor(review_response.issues))
+
+    # Building the position index parses the diff, so it runs in a thread
+    poster, comments, inline = await asyncio.to_thread(tracing.bind(anchor))
+    if poster.duplicates:
+        print(f"🔁 Skipped {poster.duplicates} findings that are already commented")
+    if not comments and not poster.unmapped:
+        print("No new findings to post, skipping review")
+        return
+    if is_stale is not None and await is_stale():
+        raise ReviewSuperseded(f"PR #{payload.number} has a newer head")
+
+    client = get_async_github_client()
+    path = f"{pr_path(payload)}/reviews"
+    body = _format_review_body(review_response, poster.unmapped)
+    print(f"📝 Posting PR review with {len(comments)} inline comments")
+    with tracing.span(
+        "github.post_review",
+        comments=len(comments),
+        unmapped=len(poster.unmapped),
+        duplicates=poster.duplicates,
+        final=True,
+    ) as span:
+        response = await client.post(
+            path,
+            installation_id=payload.installation.id,
+            json=_review_payload(payload, body, comments),
+        )
+        if response.status_code == 422 and comments:
+            print(f"❌ Review rejected ({response.status_code}): {response.text}")
+            print("🔄 Retrying with all findings in the review body")
+            body = _format_review_body(review_response, poster.unmapped + inline)
+            comments = []
+            response = await client.post(
+                path,
+                installation_id=payload.installation.id,
+                json=_review_payload(payload, body, comments),
+            )
+            span.set_attribute("rejected", True)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code not in (200, 201):
+            print(f"❌ Failed to post review ({response.status_code}): {response.text}")
+            response.raise_for_status()
+
+    if existing is not None:
+        for comment in comments:
+            existing.add(comment["path"], comment["line"], comment["body"])
+    print(
+        f"🎯 Posted review with {len(comments)} inline comments and "
+        f"{len(review_response.issues) - len(comments) - poster.duplicates} findings in the body"
+    )
+
+
+def _review_payload(payload: PullRequestEvent, body: str, comments: list) -> dict:
+    return {
+        "commit_id": payload.pull_request.head.sha,
+        "event": "COMMENT",
+        "body": body,
+        "comments": comments,
+    }
+
+
+def _create_pr_review(payload: PullRequestEvent, body: str, comments: list):
+    print(f"📝 Posting PR review with {len(comments)} inline comments")
+    return get_github_client().post(
+        f"{pr_path(payload)}/reviews",
+        installation_id=payload.installation.id,
+        json=_review_payload(payload, body, comments),
+    )
+
+
+def _format_issue_comment(issue: DiffIssue) -> str:
+    emoji = {"error": "🚫", "warning": "⚠️", "suggestion": "💡"}.get(issue.type, "ℹ️")
+    return f"{emoji} **{issue.type.title()}** ({issue.severity} severity)\n\n{issue.message}"
+
+
+def _format_review_body(
+    review_response: PRReviewResponse, unmapped: List[DiffIssue]
+) -> str:
+    parts = [f"### 🤖 TesterGPT review\n\n{review_response.summary}"]
+    if unmapped:
+        parts.append("#### Findings outside the diff")
+        for issue in unmapped:
+            parts.append(
+                f"**File: `{issue.file}` (around line {issue.line})**\n\n"
+                f"{_format_issue_comment(issue)}"
+            )
+    return "\n\n".join(parts)
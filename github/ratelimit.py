@@ -0,0 +1,190 @@
+"""
+Per-installation pacing of GitHub API calls.
+
+GitHub reports the primary budget in ``X-RateLimit-*`` headers and answers
+403/429 with ``Retry-After`` when a secondary limit is hit; content-creating
+requests (reviews, comments) have their own, stricter secondary limit.
+``RateLimitScheduler`` tracks those headers per installation, spaces write
+calls out, keeps a reserve of the budget for reads and backs off with
+jitter once GitHub pushes back. Reads always go ahead of queued writes.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Optional, Union
+
+import httpx
+import requests
+
+from core import metrics
+
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Sync and async clients share one scheduler
+Response = Union[requests.Response, httpx.Response]
+
+
+def is_rate_limited(response: Response) -> bool:
+    """True for primary or secondary rate limit responses"""
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    return (
+        response.headers.get("X-RateLimit-Remaining") == "0"
+        or "Retry-After" in response.headers
+        or "rate limit" in response.text.lower()
+    )
+
+
+class _Budget:
+    def __init__(self):
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.next_write_at = 0.0
+        self.reads_waiting = 0
+        self.condition = threading.Condition()
+
+
+class RateLimitScheduler:
+    """
+    ``acquire`` before a request and ``update`` with its response. Waits in
+    ``acquire`` never exceed ``max_wait`` so a worker is not parked for the
+    remainder of an hourly window; the request then goes out and GitHub
+    decides.
+    """
+
+    def __init__(
+        self,
+        write_interval: float = 1.0,
+        reserve: int = 50,
+        max_wait: float = 60.0,
+        backoff_base: float = 1.0,
+    ):
+        self.write_interval = write_interval
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.backoff_base = backoff_base
+        self._budgets: Dict[Optional[int], _Budget] = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, installation_id: Optional[int]) -> _Budget:
+        budget = self._budgets.get(installation_id)
+        if budget is None:
+            with self._lock:
+                budget = self._budgets.setdefault(installation_id, _Budget())
+        return budget
+
+    def _delay(self, budget: _Budget, write: bool, now: float) -> float:
+        delay = budget.blocked_until - now
+        if budget.remaining is not None and now < budget.reset_at:
+            # Writes leave the last ``reserve`` calls of the window to reads
+            floor = self.reserve if write else 0
+            if budget.remaining <= floor:
+                delay = max(delay, budget.reset_at - now)
+        if write:
+            delay = max(delay, budget.next_write_at - now)
+            if budget.reads_waiting:
+                delay = max(delay, 0.05)
+        return delay
+
+    def acquire(self, installation_id: Optional[int], method: str) -> float:
+        """Block until a call may be sent; returns the seconds waited"""
+        write = method.upper() not in READ_METHODS
+        budget = self._budget(installation_id)
+        started = time.time()
+        deadline = started + self.max_wait
+        with budget.condition:
+            if not write:
+                budget.reads_waiting += 1
+            try:
+                while True:
+                    now = time.time()
+                    delay = self._delay(budget, write, now)
+                    if delay <= 0 or now >= deadline:
+                        break
+                    budget.condition.wait(min(delay, deadline - now))
+                self._take(budget, write, time.time())
+            finally:
+                if not write:
+                    budget.reads_waiting -= 1
+                    budget.condition.notify_all()
+        return time.time() - started
+
+    async def aacquire(self, installation_id: Optional[int], method: str) -> float:
+        """``acquire`` for the event loop: sleeps instead of blocking a thread"""
+        write = method.upper() not in READ_METHODS
+        budget = self._budget(installation_id)
+        started = time.time()
+        deadline = started + self.max_wait
+        if not write:
+            with budget.condition:
+                budget.reads_waiting += 1
+        try:
+            while True:
+                with budget.condition:
+                    now = time.time()
+                    delay = self._delay(budget, write, now)
+                    if delay <= 0 or now >= deadline:
+                        self._take(budget, write, now)
+                        break
+                await asyncio.sleep(min(delay, deadline - now))
+        finally:
+            if not write:
+                with budget.condition:
+                    budget.reads_waiting -= 1
+                    budget.condition.notify_all()
+        return time.time() - started
+
+    def _take(self, budget: _Budget, write: bool, now: float) -> None:
+        if budget.remaining is not None:
+            budget.remaining -= 1
+        if write:
+            budget.next_write_at = now + self.write_interval
+
+    def update(self, installation_id: Optional[int], response: Response) -> None:
+        """Record the budget reported by a response"""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        budget = self._budget(installation_id)
+        with budget.condition:
+            try:
+                budget.remaining = int(remaining)
+                budget.reset_at = float(reset)
+            except ValueError:
+                return
+            budget.condition.notify_all()
+        metrics.GITHUB_RATE_LIMIT_REMAINING.labels(
+            "app" if installation_id is None else str(installation_id)
+        ).set(budget.remaining)
+
+    def backoff(
+        self,
+        installation_id: Optional[int],
+        response: Response,
+        attempt: int,
+    ) -> float:
+        """
+        Block the installation after a rate limit response and return the
+        delay: ``Retry-After`` if given, the window reset when the budget is
+        spent, otherwise exponential backoff with full jitter.
+        """
+        now = time.time()
+        retry_after = response.headers.get("Retry-After")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after) + random.uniform(0, 1)
+        elif response.headers.get("X-RateLimit-Remaining") == "0" and reset:
+            delay = max(float(reset) - now, 0) + random.uniform(0, 1)
+        else:
+            delay = random.uniform(0, self.backoff_base * 2**attempt)
+
+        budget = self._budget(installation_id)
+        with budget.condition:
+            budget.blocked_until = max(budget.blocked_until, now + delay)
+        return delay
@@ -1,85 +1,210 @@
-from github.types import (
-    GithubCommitDetail,
-    GithubCommitList,
-    GithubPRChanged,
-    ReviewCommentList,
+from core import tracing
+from github.types import PullRequestEvent, ReviewCommentList
+from github.client import ACCEPT_DIFF, get_async_github_client, get_github_client
+from github.comment_index import (
+    CommentIndex,
+    comment_index_cache,
+    comment_index_key,
 )
-import requests
-from unidiff import PatchSet
+from github.diff import PRDiff, diff_cache
 
+NULL_SHA = "0" * 40
 
-def get_pr_latest_commit_diff(pr: GithubPRChanged) -> str:
+
+def get_pr_push_diff(pr: PullRequestEvent) -> PRDiff:
     """
-    Get the latest commit diff using GitHub API (more accurate than PR diff)
+    Diff of exactly what a synchronize event pushed, fetched with a single
+    compare call. Falls back to the full PR diff when ``before`` is missing
+    or no longer reachable, e.g. after a force-push.
     """
     if not pr or not pr.pull_request:
         raise ValueError("Invalid pull request data provided")
 
-    commits_url = pr.pull_request.commits_url
-    if not commits_url:
-        raise ValueError("Pull request commits URL not found")
+    key = _push_range(pr)
+    if key is None:
+        print("No 'before' commit in the event, reviewing the full PR diff")
+        return get_pr_diff(pr)
+
+    with tracing.span("github.get_pr_push_diff", pr=pr.number) as span:
+        cached = diff_cache.get(key)
+        span.set_attribute("cached", cached is not None)
+        if cached is not None:
+            return cached
+
+        response = get_github_client().get(
+            _compare_path(pr, key),
+            installation_id=pr.installation.id,
+            accept=ACCEPT_DIFF,
+        )
+        if response.status_code in (404, 422):
+            print(
+                f"⚠️ Cannot compare {key} ({response.status_code}), reviewing the full PR diff"
+            )
+            return get_pr_diff(pr)
+        response.raise_for_status()  # Raise an exception for bad status codes
+
+        diff = PRDiff(key=key, raw=response.text)
+        span.set_attribute("diff_bytes", len(diff.raw))
+        diff_cache.put(diff)
+        return diff
+
+
+def _push_range(pr: PullRequestEvent):
+    """``before...after`` of a push, None when there is no usable ``before``"""
+    before = pr.before
+    after = pr.after or pr.pull_request.head.sha
+    if not before or before == NULL_SHA:
+        return None
+    return f"{before}...{after}"
+
+
+def _compare_path(pr: PullRequestEvent, key: str) -> str:
+    return f"/repos/{pr.repository.owner.login}/{pr.repository.name}/compare/{key}"
+
+
+def get_pr_diff(pr: PullRequestEvent) -> PRDiff:
+    """Full PR diff for the current head, downloaded and parsed at most once"""
+    if not pr or not pr.pull_request:
+        raise ValueError("Invalid pull request data provided")
 
-    response = requests.get(commits_url)
-    response.raise_for_status()  # Raise an exception for bad status codes
+    with tracing.span("github.get_pr_diff", pr=pr.number, cached=True) as span:
 
-    commit_list = GithubCommitList(**response.json())
+        def load_pr_diff() -> str:
+            response = _fetch_pr_diff_text(pr)
+            response.raise_for_status()  # Raise an exception for bad status codes
+            span.set_attributes(cached=False, diff_bytes=len(response.text))
+            return response.text
 
-    if not commit_list.commits:
-        raise ValueError("No commits found in the pull request")
-    latest_commit = commit_list.commits[-1]
-    if not latest_commit or not latest_commit.sha:
-        raise ValueError("Latest commit data is invalid")
+        return diff_cache.get_or_load(pr.pull_request.head.sha, load_pr_diff)
 
-    diff_url = latest_commit.commit.url
-    response = requests.get(diff_url)
-    response.raise_for_status()  # Raise an exception for bad status codes
-    response_data = response.json()
-    response_data = GithubCommitDetail(**response_data)
-    patch = [PatchSet(file.patch) for file in response_data.files if file.patch]
-    pr_line_data = ""
 
-    for patched_file in patch:
-        pr_line_data += f"File: {patched_file.path}\n"
-        for hunk in patched_file:
-            for line in hunk:
-                pr_line_data += f"{line.line_type}: {line.value.strip()}\n"
+def _fetch_pr_diff_text(pr: PullRequestEvent):
+    """
+    Download the PR diff through the REST API. Unlike ``diff_url`` on
+    github.com this works for private repositories and honours the client's
+    base URL.
+    """
+    return get_github_client().get(
+        pr_path(pr),
+        installation_id=pr.installation.id,
+        accept=ACCEPT_DIFF,
+    )
 
-    print(f"PR Lines: {pr_line_data}")
-    return pr_line_data
 
+def pr_path(pr: PullRequestEvent) -> str:
+    return f"/repos/{pr.repository.owner.login}/{pr.repository.name}/pulls/{pr.pull_request.number}"
 
-def get_pr_diff(pr: GithubPRChanged) -> ReviewCommentList:
+
+def get_pr_comments(pr: PullRequestEvent) -> ReviewCommentList:
+    """Every review comment on the PR, across all pages"""
     if not pr or not pr.pull_request:
         raise ValueError("Invalid pull request data provided")
 
-    diff_url = pr.pull_request.diff_url
-    if not diff_url:
-        raise ValueError("Pull request diff URL not found")
+    review_comments_url = pr.pull_request.review_comments_url
+    if not review_comments_url:
+        raise ValueError("Pull request review comments URL not found")
 
-    response = requests.get(diff_url)
-    response.raise_for_status()  # Raise an exception for bad status codes
+    comments = get_github_client().paginate(
+        review_comments_url, installation_id=pr.installation.id
+    )
+    return ReviewCommentList(list(comments))
 
-    patch = PatchSet(response.text)
-    pr_line_data = ""
 
-    for patched_file in patch:
-        pr_line_data += f"File: {patched_file.path}\n"
-        for hunk in patched_file:
-            for line in hunk:
-                pr_line_data += f"{line.line_type}: {line.value.strip()}\n"
-    return pr_line_data
+def get_comment_index(pr: PullRequestEvent) -> CommentIndex:
+    """Index of the bot's existing comments, cached per PR head"""
+    key = comment_index_key(pr)
+    with tracing.span("github.get_comment_index", pr=pr.number) as span:
+        index = comment_index_cache.get(key)
+        span.set_attribute("cached", index is not None)
+        if index is None:
+            index = CommentIndex.from_comments(get_pr_comments(pr).root)
+            comment_index_cache.put(key, index)
+            print(f"🗂️ Indexed {len(index)} existing bot comments on PR #{pr.number}")
+        span.set_attribute("comments", len(index))
+        return index
 
 
-def get_pr_comments(pr: GithubPRChanged) -> str:
+# Async variants for the event-loop worker. They share the diff and comment
+# caches with the sync functions above.
+
+
+async def aget_pr_push_diff(pr: PullRequestEvent) -> PRDiff:
+    """Async ``get_pr_push_diff``"""
     if not pr or not pr.pull_request:
         raise ValueError("Invalid pull request data provided")
 
-    review_comments_url = pr.pull_request.review_comments_url
-    if not review_comments_url:
-        raise ValueError("Pull request review comments URL not found")
-
-    response = requests.get(review_comments_url)
-    response.raise_for_status()  # Raise an exception for bad status codes
-    review_comment_list = ReviewCommentList(**response.json())
+    key = _push_range(pr)
+    if key is None:
+        print("No 'before' commit in the event, reviewing the full PR diff")
+        return await aget_pr_diff(pr)
+
+    with tracing.span("github.get_pr_push_diff", pr=pr.number) as span:
+        cached = diff_cache.get(key)
+        span.set_attribute("cached", cached is not None)
+        if cached is not None:
+            return cached
+
+        response = await get_async_github_client().get(
+            _compare_path(pr, key),
+            installation_id=pr.installation.id,
+            accept=ACCEPT_DIFF,
+        )
+        if response.status_code in (404, 422):
+            print(
+                f"⚠️ Cannot compare {key} ({response.status_code}), reviewing the full PR diff"
+            )
+            return await aget_pr_diff(pr)
+        response.raise_for_status()
+
+        diff = PRDiff(key=key, raw=response.text)
+        span.set_attribute("diff_bytes", len(diff.raw))
+        diff_cache.put(diff)
+        return diff
+
+
+async def aget_pr_diff(pr: PullRequestEvent) -> PRDiff:
+    """Async ``get_pr_diff``"""
+    if not pr or not pr.pull_request:
+        raise ValueError("Invalid pull request data provided")
 
-    return review_comment_list
+    key = pr.pull_request.head.sha
+    with tracing.span("github.get_pr_diff", pr=pr.number) as span:
+        cached = diff_cache.get(key)
+        span.set_attribute("cached", cached is not None)
+        if cached is not None:
+            return cached
+
+        response = await get_async_github_client().get(
+            pr_path(pr), installation_id=pr.installation.id, accept=ACCEPT_DIFF
+        )
+        response.raise_for_status()
+        diff = PRDiff(key=key, raw=response.text)
+        span.set_attribute("diff_bytes", len(diff.raw))
+        diff_cache.put(diff)
+        return diff
+
+
+async def aget_comment_index(pr: PullRequestEvent) -> CommentIndex:
+    """Async ``get_comment_index``"""
+    key = comment_index_key(pr)
+    with tracing.span("github.get_comment_index", pr=pr.number) as span:
+        index = comment_index_cache.get(key)
+        span.set_attribute("cached", index is not None)
+        if index is not None:
+            return index
+
+        review_comments_url = pr.pull_request.review_comments_url
+        if not review_comments_url:
+            raise ValueError("Pull request review comments URL not found")
+
+        comments = [
+            comment
+            async for comment in get_async_github_client().paginate(
+                review_comments_url, installation_id=pr.installation.id
+            )
+        ]
+        index = CommentIndex.from_comments(ReviewCommentList(comments).root)
+        comment_index_cache.put(key, index)
+        span.set_attribute("comments", len(index))
+        print(f"🗂️ Indexed {len(index)} existing bot comments on PR #{pr.number}")
+        return index
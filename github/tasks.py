@@ -0,0 +1,411 @@
+"""
+Background review jobs.
+
+The webhook only records a ``ReviewJob``; the ``review_worker`` management
+command claims pending jobs and runs the diff -> review -> post pipeline.
+"""
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core import metrics, tracing
+from core.llm_client import areview_diff, review_diff
+from github.comment_index import CommentIndex
+from github.diff import PRDiff
+from github.models import ReviewJob
+from github.posting import (
+    ReviewPoster,
+    ReviewSuperseded,
+    apost_pr_comments,
+    post_pr_comments,
+)
+from github.service import (
+    aget_comment_index,
+    aget_pr_diff,
+    aget_pr_push_diff,
+    get_comment_index,
+    get_pr_diff,
+    get_pr_push_diff,
+)
+from github.types import PullRequestEvent
+from testergpt.settings import settings
+
+REVIEWABLE_ACTIONS = ("opened", "synchronize")
+
+# Jobs for the same head SHA that make a new event redundant
+COVERING_STATUSES = (
+    ReviewJob.STATUS_PENDING,
+    ReviewJob.STATUS_RUNNING,
+    ReviewJob.STATUS_DONE,
+)
+
+
+def find_duplicate_job(delivery: str, payload: PullRequestEvent) -> Optional[ReviewJob]:
+    """
+    Job created within REVIEW_IDEMPOTENCY_TTL for the same delivery, or one
+    that already reviewed or is reviewing the same head SHA.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.REVIEW_IDEMPOTENCY_TTL)
+    recent = ReviewJob.objects.filter(created_at__gte=cutoff)
+    if delivery and delivery != "unknown":
+        job = recent.filter(delivery_id=delivery).first()
+        if job is not None:
+            return job
+    return recent.filter(
+        repository=payload.repository.full_name,
+        pr_number=payload.number,
+        head_sha=payload.pull_request.head.sha,
+        status__in=COVERING_STATUSES,
+    ).first()
+
+
+def enqueue_review(
+    event: str, delivery: str, payload: PullRequestEvent
+) -> Tuple[ReviewJob, bool]:
+    """
+    Persist a review job for a validated pull request event. Returns the
+    job and whether it was created; redeliveries and events for a head SHA
+    that is already covered return the existing job.
+    """
+    try:
+        # The duplicate check runs under the same write lock as the insert
+        with transaction.atomic():
+            duplicate = find_duplicate_job(delivery, payload)
+            if duplicate is not None:
+                return duplicate, False
+
+            payload = coalesce_pending_reviews(payload)
+            available_at = timezone.now()
+            if payload.action == "synchronize":
+                # Wait for follow-up pushes; each one moves the review back again
+                available_at += timedelta(seconds=settings.REVIEW_SYNC_DEBOUNCE_SECONDS)
+            job = _create_job(event, delivery, payload, available_at)
+    except IntegrityError:
+        # A concurrent redelivery of the same delivery id won the insert
+        return ReviewJob.objects.get(delivery_id=delivery), False
+    return job, True
+
+
+def _create_job(
+    event: str, delivery: str, payload: PullRequestEvent, available_at
+) -> ReviewJob:
+    return ReviewJob.objects.create(
+        delivery_id=delivery,
+        event=event,
+        action=payload.action,
+        repository=payload.repository.full_name,
+        pr_number=payload.number,
+        head_sha=payload.pull_request.head.sha,
+        # Only the projected fields are stored, not the full delivery
+        payload=payload.model_dump(mode="json"),
+        traceparent=tracing.traceparent(),
+        available_at=available_at,
+    )
+
+
+def coalesce_pending_reviews(payload: PullRequestEvent) -> PullRequestEvent:
+    """
+    Supersede the PR's pending jobs and widen ``payload`` to cover them and
+    any running job, which drops its own results once it notices the newer
+    head. The new job reviews from the oldest covered ``before``, or the
+    whole PR if one of them was for ``opened``.
+    """
+    covered = list(
+        ReviewJob.objects.select_for_update()
+        .filter(
+            repository=payload.repository.full_name,
+            pr_number=payload.number,
+            status__in=(ReviewJob.STATUS_PENDING, ReviewJob.STATUS_RUNNING),
+        )
+        .exclude(head_sha=payload.pull_request.head.sha)
+        .order_by("id")
+    )
+    if not covered:
+        return payload
+
+    ReviewJob.objects.filter(
+        pk__in=[job.pk for job in covered if job.status == ReviewJob.STATUS_PENDING]
+    ).update(status=ReviewJob.STATUS_SUPERSEDED, finished_at=timezone.now())
+    print(
+        f"🔀 Coalescing {len(covered)} earlier reviews of PR #{payload.number} "
+        f"into {payload.pull_request.head.sha[:7]}"
+    )
+
+    if payload.action == "opened" or any(job.action == "opened" for job in covered):
+        return payload.model_copy(update={"action": "opened"})
+    oldest_before = covered[0].payload.get("before")
+    if oldest_before:
+        return payload.model_copy(update={"before": oldest_before})
+    return payload
+
+
+def is_superseded(payload: PullRequestEvent) -> bool:
+    """True once a newer head of the PR has been queued"""
+    latest = (
+        ReviewJob.objects.filter(
+            repository=payload.repository.full_name, pr_number=payload.number
+        )
+        .exclude(status=ReviewJob.STATUS_FAILED)
+        .order_by("-id")
+        .values_list("head_sha", flat=True)
+        .first()
+    )
+    return latest is not None and latest != payload.pull_request.head.sha
+
+
+def claim_next_job() -> Optional[ReviewJob]:
+    """
+    Atomically move the oldest available pending job to running.
+    Returns None when there is nothing to do.
+    """
+    now = timezone.now()
+    candidates = ReviewJob.objects.filter(
+        status=ReviewJob.STATUS_PENDING, available_at__lte=now
+    ).values_list("pk", flat=True)[:10]
+
+    for pk in candidates:
+        # Compare-and-set so concurrent workers never claim the same job
+        claimed = ReviewJob.objects.filter(
+            pk=pk, status=ReviewJob.STATUS_PENDING
+        ).update(
+            status=ReviewJob.STATUS_RUNNING,
+            attempts=F("attempts") + 1,
+            started_at=now,
+        )
+        if claimed:
+            return ReviewJob.objects.get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs() -> int:
+    """Return jobs whose worker died mid-run back to the pending queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.REVIEW_JOB_LEASE_SECONDS)
+    return ReviewJob.objects.filter(
+        status=ReviewJob.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(status=ReviewJob.STATUS_PENDING, available_at=timezone.now())
+
+
+def run_review_job(job: ReviewJob) -> None:
+    """Execute a claimed job and record its outcome"""
+    print(f"🛠️ Running review job {job.pk} for {job.repository}#{job.pr_number}")
+    with metrics.REVIEWS_IN_FLIGHT.track_inprogress(), _job_span(job):
+        try:
+            payload = PullRequestEvent.model_validate(job.payload)
+            review_pull_request(payload)
+        except Exception as e:
+            record_job_error(job, e)
+            return
+        record_job_done(job)
+
+
+async def arun_review_job(job: ReviewJob) -> None:
+    """``run_review_job`` on the event loop"""
+    print(f"🛠️ Running review job {job.pk} for {job.repository}#{job.pr_number}")
+    with metrics.REVIEWS_IN_FLIGHT.track_inprogress(), _job_span(job):
+        try:
+            payload = PullRequestEvent.model_validate(job.payload)
+            await areview_pull_request(payload)
+        except Exception as e:
+            await sync_to_async(record_job_error)(job, e)
+            return
+        await sync_to_async(record_job_done)(job)
+
+
+def _job_span(job: ReviewJob):
+    """Span for one attempt, in the trace of the delivery that queued the job"""
+    span = tracing.span(
+        "review.job",
+        parent=job.traceparent,
+        job_id=job.pk,
+        repository=job.repository,
+        pr=job.pr_number,
+        action=job.action,
+        attempt=job.attempts,
+    )
+    if job.started_at and job.available_at:
+        waited = (job.started_at - job.available_at).total_seconds()
+        span.set_attribute("queue_wait_ms", round(waited * 1000, 1))
+        metrics.QUEUE_WAIT_SECONDS.observe(max(waited, 0))
+    return span
+
+
+def record_job_error(job: ReviewJob, error: Exception) -> None:
+    """Mark a job superseded, or schedule a retry until it runs out of attempts"""
+    tracing.current_span().set_attribute("error", f"{type(error).__name__}: {error}")
+    if isinstance(error, ReviewSuperseded):
+        print(f"⏭️ Review job {job.pk} superseded: {error}")
+        job.status = ReviewJob.STATUS_SUPERSEDED
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "finished_at"])
+        _record_status(job)
+        return
+
+    print(f"❌ Review job {job.pk} failed (attempt {job.attempts}): {error}")
+    job.error = str(error)
+    if job.attempts < settings.REVIEW_JOB_MAX_ATTEMPTS:
+        job.status = ReviewJob.STATUS_PENDING
+        job.available_at = timezone.now() + timedelta(
+            seconds=settings.REVIEW_JOB_RETRY_DELAY * job.attempts
+        )
+    else:
+        job.status = ReviewJob.STATUS_FAILED
+        job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "available_at", "finished_at"])
+    _record_status(job)
+
+
+def _record_status(job: ReviewJob) -> None:
+    """Outcome of an attempt; a job back in the queue is counted as a retry"""
+    tracing.current_span().set_attribute("status", job.status)
+    status = "retry" if job.status == ReviewJob.STATUS_PENDING else job.status
+    metrics.REVIEW_JOBS.labels(status).inc()
+
+
+def record_job_done(job: ReviewJob) -> None:
+    job.status = ReviewJob.STATUS_DONE
+    job.error = ""
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "finished_at"])
+    _record_status(job)
+    print(f"✅ Review job {job.pk} completed")
+
+
+def review_pull_request(payload: PullRequestEvent) -> None:
+    """Fetch the diff, run the AI review and post the findings"""
+    if payload.action not in REVIEWABLE_ACTIONS:
+        print(f"Action {payload.action} is not reviewable, skipping")
+        return
+
+    print(f"🔍 Fetching diff content for PR #{payload.number}")
+    pr_diff = get_pr_diff(payload)
+    if payload.action == "opened":
+        target_diff = pr_diff
+    else:
+        target_diff = get_pr_push_diff(payload)
+    print(f"📄 Retrieved diff content ({len(target_diff.raw)} characters)")
+
+    if not target_diff.raw.strip():
+        print(f"PR #{payload.number} has an empty diff, skipping review")
+        return
+    if is_superseded(payload):
+        raise ReviewSuperseded(f"PR #{payload.number} has a newer head")
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # Existing comments are fetched while the model is working
+        existing_comments = pool.submit(tracing.bind(get_comment_index), payload)
+
+        if settings.LLM_STREAMING:
+            _review_and_post_streaming(payload, pr_diff, target_diff, existing_comments)
+            print(f"✅ Successfully processed PR #{payload.number}")
+            return
+
+        print(f"🤖 Running AI review on diff...")
+        review_response = review_diff(target_diff)
+        print(
+            f"📝 AI review completed with {len(review_response.issues) if review_response.issues else 0} issues found"
+        )
+
+        try:
+            existing = existing_comments.result()
+        except Exception as e:
+            print(f"⚠️ Could not load existing comments, not deduplicating: {e}")
+            existing = None
+
+    post_pr_comments(
+        payload,
+        review_response=review_response,
+        pr_diff=pr_diff,
+        existing=existing,
+        is_stale=lambda: is_superseded(payload),
+    )
+    print(f"✅ Successfully processed PR #{payload.number}")
+
+
+def _review_and_post_streaming(
+    payload: PullRequestEvent,
+    pr_diff: PRDiff,
+    target_diff: PRDiff,
+    existing_comments: "Future[CommentIndex]",
+) -> None:
+    """Post findings in batches while the model output is still streaming"""
+    poster = ReviewPoster(
+        payload,
+        pr_diff,
+        existing_comments,
+        batch_size=settings.REVIEW_POST_BATCH_SIZE,
+        batch_seconds=settings.REVIEW_POST_BATCH_SECONDS,
+        is_stale=lambda: is_superseded(payload),
+    )
+    print(f"🤖 Streaming AI review on diff...")
+    try:
+        review_response = review_diff(
+            target_diff, on_issue=poster.add, checkpoint=poster.checkpoint
+        )
+    except Exception:
+        poster.stop()
+        if poster.cancelled:
+            raise ReviewSuperseded(f"PR #{payload.number} has a newer head")
+        raise
+    print(f"📝 AI review completed with {len(review_response.issues)} issues found")
+    poster.close(review_response)
+    if poster.cancelled:
+        raise ReviewSuperseded(f"PR #{payload.number} has a newer head")
+
+
+async def areview_pull_request(payload: PullRequestEvent) -> None:
+    """
+    ``review_pull_request`` on the event loop. The diffs and existing
+    comments are fetched concurrently and the LLM is called with
+    ``ainvoke``, so a single process can hold many reviews in flight.
+    Findings are posted in one review; LLM_STREAMING only applies to the
+    threaded worker.
+    """
+    if payload.action not in REVIEWABLE_ACTIONS:
+        print(f"Action {payload.action} is not reviewable, skipping")
+        return
+
+    print(f"🔍 Fetching diff content for PR #{payload.number}")
+    existing_comments = asyncio.create_task(aget_comment_index(payload))
+    try:
+        if payload.action == "opened":
+            pr_diff = target_diff = await aget_pr_diff(payload)
+        else:
+            pr_diff, target_diff = await asyncio.gather(
+                aget_pr_diff(payload), aget_pr_push_diff(payload)
+            )
+        print(f"📄 Retrieved diff content ({len(target_diff.raw)} characters)")
+
+        if not target_diff.raw.strip():
+            print(f"PR #{payload.number} has an empty diff, skipping review")
+            return
+        if await sync_to_async(is_superseded)(payload):
+            raise ReviewSuperseded(f"PR #{payload.number} has a newer head")
+
+        print(f"🤖 Running AI review on diff...")
+        review_response = await areview_diff(target_diff)
+        print(f"📝 AI review completed with {len(review_response.issues)} issues found")
+
+        try:
+            existing = await existing_comments
+        except Exception as e:
+            print(f"⚠️ Could not load existing comments, not deduplicating: {e}")
+            existing = None
+    finally:
+        if not existing_comments.done():
+            existing_comments.cancel()
+
+    await apost_pr_comments(
+        payload,
+        review_response=review_response,
+        pr_diff=pr_diff,
+        existing=existing,
+        is_stale=lambda: sync_to_async(is_superseded)(payload),
+    )
+    print(f"✅ Successfully processed PR #{payload.number}")
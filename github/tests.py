@@ -0,0 +1,126 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from benchmarks.payloads import pull_request_event
+from core.types import DiffIssue
+from github.client import AsyncGitHubClient
+from github.diff import PRDiff
+from github.models import ReviewJob
+from github.posting import ReviewPoster, ReviewSuperseded
+from github.tasks import enqueue_review
+from github.types import PullRequestEvent
+
+SAMPLE_DIFF = """diff --git a/src/app.py b/src/app.py
+--- a/src/app.py
++++ b/src/app.py
+@@ -1,3 +1,5 @@
+ import os
+-import sys
++import sys, json
++x = 1
++y = 2
+ print(os)
+"""
+
+
+class AsyncGitHubClientTests(SimpleTestCase):
+    def test_pool_size_limits_the_connection_pool(self):
+        client = AsyncGitHubClient(pool_size=7)
+        pool = client._client._transport._pool
+        self.assertEqual(pool._max_connections, 7)
+        self.assertEqual(pool._max_keepalive_connections, 7)
+
+
+class ReviewPosterTests(SimpleTestCase):
+    def setUp(self):
+        self.payload = PullRequestEvent.model_validate(
+            pull_request_event(number=1, head_sha="abc123")
+        )
+        self.pr_diff = PRDiff(key="abc123", raw=SAMPLE_DIFF)
+        self.posted = []
+        self.submitted = threading.Event()
+
+    def issue(self, line: str) -> DiffIssue:
+        return DiffIssue(
+            file="src/app.py",
+            line=line,
+            type="error",
+            severity="high",
+            message=f"Problem on line {line}",
+        )
+
+    def record_submit(self, body, comments, inline, unmapped, summary=None):
+        self.posted.append((threading.current_thread(), list(inline)))
+        self.submitted.set()
+
+    def test_add_only_queues_and_the_poster_thread_posts(self):
+        poster = ReviewPoster(self.payload, self.pr_diff, batch_size=1)
+        poster._submit = self.record_submit
+        poster.add(self.issue("2"))
+        self.assertTrue(self.submitted.wait(2))
+        poster.stop()
+
+        thread, inline = self.posted[0]
+        self.assertIsNot(thread, threading.current_thread())
+        self.assertEqual([issue.line for issue in inline], ["2"])
+
+    def test_failed_batch_is_requeued_and_the_thread_keeps_running(self):
+        poster = ReviewPoster(self.payload, self.pr_diff, batch_size=1)
+        attempts = []
+
+        def flaky_submit(body, comments, inline, unmapped, summary=None):
+            attempts.append(len(inline))
+            if len(attempts) == 1:
+                raise RuntimeError("GitHub returned 502")
+            self.record_submit(body, comments, inline, unmapped, summary)
+
+        poster._submit = flaky_submit
+        poster.add(self.issue("2"))
+        # Retried after the backoff, together with the next finding
+        poster.add(self.issue("3"))
+        self.assertTrue(self.submitted.wait(5))
+        poster.stop()
+
+        self.assertGreaterEqual(len(attempts), 2)
+        posted = [issue.line for _, inline in self.posted for issue in inline]
+        self.assertCountEqual(posted, ["2", "3"])
+        self.assertEqual(poster._pending, [])
+
+    def test_poster_thread_notices_a_newer_head_without_findings(self):
+        stale = threading.Event()
+        poster = ReviewPoster(
+            self.payload, self.pr_diff, batch_seconds=0.05, is_stale=stale.is_set
+        )
+        poster._submit = self.record_submit
+        stale.set()
+        poster._thread.join(2)
+        self.assertTrue(poster.cancelled)
+        with self.assertRaises(ReviewSuperseded):
+            poster.checkpoint()
+        poster.stop()
+        self.assertEqual(self.posted, [])
+
+
+class EnqueueReviewTests(TestCase):
+    def setUp(self):
+        self.payload = PullRequestEvent.model_validate(
+            pull_request_event(number=1, head_sha="abc123")
+        )
+
+    def test_redelivery_returns_the_existing_job(self):
+        job, created = enqueue_review("pull_request", "delivery-1", self.payload)
+        self.assertTrue(created)
+        again, created = enqueue_review("pull_request", "delivery-1", self.payload)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, job.pk)
+
+    def test_concurrent_redelivery_loses_on_the_unique_constraint(self):
+        job, _ = enqueue_review("pull_request", "delivery-1", self.payload)
+        # As if the other request had not committed yet when this one checked
+        with mock.patch("github.tasks.find_duplicate_job", return_value=None):
+            again, created = enqueue_review("pull_request", "delivery-1", self.payload)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, job.pk)
+        self.assertEqual(ReviewJob.objects.count(), 1)
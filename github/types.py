@@ -1,7 +1,7 @@
 from ninja import Schema
 from typing import List, Optional
 from datetime import datetime
-from pydantic import RootModel, Field
+from pydantic import BaseModel, RootModel, Field
 
 
 class GitHubUser(Schema):
@@ -213,6 +213,56 @@ class GithubPRChanged(Schema):
     installation: GitHubInstallation
 
 
+# Lean projection of a pull_request webhook: only the fields the review
+# pipeline reads. Plain pydantic models validated straight from the raw body;
+# every other key in the payload is skipped by the JSON parser.
+
+
+class EventUser(BaseModel):
+    login: str
+
+
+class EventRepository(BaseModel):
+    name: str
+    full_name: str
+    owner: EventUser
+
+
+class EventBranch(BaseModel):
+    ref: str
+    sha: str
+
+
+class EventPullRequest(BaseModel):
+    number: int
+    state: str
+    title: str
+    html_url: str
+    review_comments_url: str
+    head: EventBranch
+    base: EventBranch
+
+
+class EventInstallation(BaseModel):
+    id: int
+
+
+class PullRequestEvent(BaseModel):
+    """
+    What the pipeline needs from a pull_request delivery. Validate with
+    ``PullRequestEvent.model_validate_json(body)``; ``GithubPRChanged``
+    remains the full schema of the payload.
+    """
+
+    action: str
+    number: int
+    pull_request: EventPullRequest
+    before: Optional[str] = None
+    after: Optional[str] = None
+    repository: EventRepository
+    installation: EventInstallation
+
+
 class GitHubCommitAuthor(Schema):
     name: str
     email: str
@@ -1,13 +1,26 @@
 import hmac
 import hashlib
-from testergpt.settings import settings
+import json
+import re
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+from pathlib import Path
+from testergpt.settings import BASE_DIR, settings
+from cryptography.hazmat.primitives import serialization
+from core import tracing
+from github.client import get_github_client
 import jwt
 import time
 import requests
 
-GITHUB_COMMIT_INLINE_COMMENT_URL_TEMPLATE = (
-    "https://api.github.com/repos/{owner}/{repo}/pulls/{pull_number}/comments"
-)
+JWT_TTL_SECONDS = 10 * 60
+INSTALLATION_TOKEN_TTL_SECONDS = 60 * 60
+
+# GitHub serializes "action" as the first key of every webhook payload
+_LEADING_ACTION = re.compile(rb'\A\s*\{\s*"action"\s*:\s*"([^"\\]*)"')
+ACTION_PREFIX_BYTES = 256
 
 
 def verify_signature(request_body: bytes, signature_header: str) -> bool:
@@ -45,31 +58,72 @@ def verify_signature(request_body: bytes, signature_header: str) -> bool:
     return hmac.compare_digest(expected, signature)
 
 
+def peek_action(request_body: bytes) -> Optional[str]:
+    """
+    Read the top-level "action" from the start of a webhook body without
+    decoding the rest. Returns None if it is not the leading key.
+    """
+    match = _LEADING_ACTION.match(request_body[:ACTION_PREFIX_BYTES])
+    return match.group(1).decode("utf-8") if match else None
+
+
+_record_lock = threading.Lock()
+
+
+def record_delivery(event: str, delivery: str, body: bytes) -> None:
+    """Append a delivery to WEBHOOK_RECORD_FILE, if set, for later replay"""
+    if not settings.WEBHOOK_RECORD_FILE:
+        return
+    path = Path(settings.WEBHOOK_RECORD_FILE)
+    if not path.is_absolute():
+        path = BASE_DIR / path
+    line = json.dumps(
+        {
+            "event": event,
+            "delivery": delivery,
+            "received_at": time.time(),
+            "body": body.decode("utf-8"),
+        }
+    )
+    try:
+        with _record_lock, path.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"⚠️ Could not record delivery {delivery}: {e}")
+
+
+@lru_cache(maxsize=1)
+def _load_private_key():
+    """Parse the GitHub App PEM once; PyJWT accepts the key object directly"""
+    private_key = settings.GITHUB_PRIVATE_KEY
+    print(f"🔑 Private key length: {len(private_key) if private_key else 0} characters")
+
+    if not private_key:
+        raise ValueError("GitHub Private Key is not configured")
+
+    return serialization.load_pem_private_key(
+        private_key.encode("utf-8"), password=None
+    )
+
+
 def generate_jwt() -> str:
     now = int(time.time())
-    app_id, private_key = settings.GITHUB_APP_ID, settings.GITHUB_PRIVATE_KEY
+    app_id = settings.GITHUB_APP_ID
 
     # Debug information
     print(f"🔐 Generating JWT for GitHub App ID: {app_id}")
-    print(f"🔑 Private key length: {len(private_key) if private_key else 0} characters")
-    print(
-        f"🔑 Private key starts with: {private_key[:50] if private_key else 'None'}..."
-    )
 
     if not app_id or app_id == 0:
         raise ValueError("GitHub App ID is not configured")
 
-    if not private_key:
-        raise ValueError("GitHub Private Key is not configured")
-
     payload = {
         "iat": now - 60,  # issued at
-        "exp": now + (10 * 60),  # JWT valid for 10 minutes
+        "exp": now + JWT_TTL_SECONDS,  # JWT valid for 10 minutes
         "iss": str(app_id),  # GitHub App ID (ensure it's a string)
     }
 
     try:
-        token = jwt.encode(payload, private_key, algorithm="RS256")
+        token = jwt.encode(payload, _load_private_key(), algorithm="RS256")
         print(f"✅ JWT generated successfully")
         return token
     except Exception as e:
@@ -77,19 +131,17 @@ def generate_jwt() -> str:
         raise
 
 
-def get_installation_token(jwt_token: str, installation_id: int) -> str:
-    url = f"https://api.github.com/app/installations/{installation_id}/access_tokens"
-    headers = {
-        "Authorization": f"Bearer {jwt_token}",
-        "Accept": "application/vnd.github+json",
-        "X-GitHub-Api-Version": "2022-11-28",
-    }
+def _request_installation_token(
+    jwt_token: str, installation_id: int
+) -> Tuple[str, float]:
+    """Exchange an app JWT for an installation token and its expiry timestamp"""
+    url = f"/app/installations/{installation_id}/access_tokens"
 
     print(f"🔗 Requesting installation token from: {url}")
     print(f"📋 JWT token length: {len(jwt_token)} characters")
 
     try:
-        resp = requests.post(url, headers=headers)
+        resp = get_github_client().post(url, token=jwt_token)
         print(f"📡 GitHub API response status: {resp.status_code}")
 
         if resp.status_code != 201:
@@ -99,7 +151,7 @@ def get_installation_token(jwt_token: str, installation_id: int) -> str:
         resp.raise_for_status()
         token_data = resp.json()
         print(f"✅ Installation token obtained successfully")
-        return token_data["token"]
+        return token_data["token"], _parse_expires_at(token_data.get("expires_at"))
     except requests.exceptions.HTTPError as e:
         print(f"❌ HTTP Error getting installation token: {e}")
         print(
@@ -109,3 +161,80 @@ def get_installation_token(jwt_token: str, installation_id: int) -> str:
     except Exception as e:
         print(f"❌ Unexpected error getting installation token: {e}")
         raise
+
+
+def _parse_expires_at(expires_at: Optional[str]) -> float:
+    """GitHub returns ISO-8601 timestamps such as 2016-07-11T22:14:10Z"""
+    if not expires_at:
+        return time.time() + INSTALLATION_TOKEN_TTL_SECONDS
+    return datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp()
+
+
+class _CachedToken(NamedTuple):
+    token: str
+    expires_at: float
+
+
+class InstallationTokenCache:
+    """
+    Thread-safe cache of the app JWT and per-installation access tokens.
+    Tokens are refreshed ``refresh_margin`` seconds before they expire and
+    concurrent refreshes for the same installation share a single request.
+    """
+
+    def __init__(self, refresh_margin: int):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._jwt: Optional[_CachedToken] = None
+        self._tokens: Dict[int, _CachedToken] = {}
+        self._refresh_locks: Dict[int, threading.Lock] = {}
+
+    def _is_fresh(self, cached: Optional[_CachedToken]) -> bool:
+        return (
+            cached is not None and cached.expires_at - self.refresh_margin > time.time()
+        )
+
+    def get_app_jwt(self) -> str:
+        with self._lock:
+            if not self._is_fresh(self._jwt):
+                self._jwt = _CachedToken(generate_jwt(), time.time() + JWT_TTL_SECONDS)
+            return self._jwt.token
+
+    def cached_token(self, installation_id: int) -> Optional[str]:
+        """Fresh cached token without locking or I/O, None if it needs a refresh"""
+        cached = self._tokens.get(installation_id)
+        return cached.token if self._is_fresh(cached) else None
+
+    def get_token(self, installation_id: int) -> str:
+        cached = self._tokens.get(installation_id)
+        if self._is_fresh(cached):
+            return cached.token
+
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(
+                installation_id, threading.Lock()
+            )
+
+        with refresh_lock:
+            # Another thread may have refreshed while we waited for the lock
+            cached = self._tokens.get(installation_id)
+            if self._is_fresh(cached):
+                return cached.token
+
+            with tracing.span(
+                "github.installation_token", installation_id=installation_id
+            ):
+                token, expires_at = _request_installation_token(
+                    self.get_app_jwt(), installation_id
+                )
+            self._tokens[installation_id] = _CachedToken(token, expires_at)
+            return token
+
+    def invalidate(self, installation_id: int) -> None:
+        """Drop a token GitHub rejected so the next call fetches a new one"""
+        self._tokens.pop(installation_id, None)
+
+
+installation_tokens = InstallationTokenCache(
+    refresh_margin=settings.GITHUB_TOKEN_REFRESH_MARGIN
+)
@@ -2,22 +2,31 @@
 Github related integrations
 """
 
-import json
-import requests
-from typing import Dict, Optional, Tuple
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, OperationalError
+from django.db.models import Count, Min
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
-from core.llm_client import review_pr
-from github.service import get_pr_diff, get_pr_latest_commit_diff
 from rest_framework.response import Response
-from github.types import GithubPRChanged
-from core.types import PRReviewResponse
-from github.utils import (
-    GITHUB_COMMIT_INLINE_COMMENT_URL_TEMPLATE,
-    generate_jwt,
-    get_installation_token,
+from core import metrics, tracing
+from github.models import ReviewJob
+from github.tasks import REVIEWABLE_ACTIONS, enqueue_review
+from github.types import PullRequestEvent
+from github.utils import peek_action, record_delivery, verify_signature
+from testergpt.settings import settings
+
+# (event, action) pairs that can lead to a review; every other delivery is
+# dropped from its headers and the first bytes of the body.
+ACCEPTED_DELIVERIES = frozenset(
+    ("pull_request", action) for action in REVIEWABLE_ACTIONS
 )
-from unidiff import PatchSet
+ACCEPTED_EVENTS = frozenset(event for event, _ in ACCEPTED_DELIVERIES)
 
 
 @api_view(["GET"])
@@ -28,313 +37,146 @@ def health_check(request):
     )
 
 
-@api_view(["POST"])
-@permission_classes([AllowAny])
-def github_webhook(request):
+# Plain async view: under ASGI a delivery never ties up a worker thread while
+# it waits on the database.
+@csrf_exempt
+@require_POST
+async def github_webhook(request):
     event = request.headers.get("X-GitHub-Event", "unknown")
     delivery = request.headers.get("X-GitHub-Delivery", "unknown")
+    with tracing.span("github.webhook", event=event, delivery=delivery) as span:
+        response = await _handle_webhook(request, event, delivery, span)
+        span.set_attribute("http.status_code", response.status_code)
+    _count_delivery(request, event, response.status_code)
+    return response
 
-    # handle events
-    print(f"Received event={event} delivery={delivery}")
-    if event == "ping":
-        return Response({"msg": "pong"}, status=200)
-
-    # PR Opened for first time
-    if event == "pull_request" and request.data.get("action") == "opened":
-        try:
-            payload = GithubPRChanged(**request.data)
-            print(
-                f"✅ Successfully parsed webhook payload for PR #{payload.number}: {payload.pull_request.title}"
-            )
-        except Exception as e:
-            print(f"Failed to parse webhook payload: {e}")
-            print(
-                f"Request data keys: {list(request.data.keys()) if hasattr(request, 'data') else 'No data'}"
-            )
-            return Response({"error": "Invalid payload structure"}, status=400)
-
-        if not payload.pull_request.state == "open":
-            print(f"PR #{payload.number} is not open, skipping processing")
-            return Response({"msg": "PR not open, skipping"}, status=200)
-
-        # Fetch diff
-        try:
-            print(f"🔍 Fetching diff content for PR #{payload.number}")
-            diff_text = get_pr_diff(payload)
-            print(f"📄 Retrieved diff content ({len(diff_text)} characters)")
-
-            # ai
-            print(f"🤖 Running AI review on diff...")
-            review_response = review_pr(diff=diff_text)
-            print(
-                f"📝 AI review completed with {len(review_response.issues) if review_response.issues else 0} issues found"
-            )
-
-            post_pr_comments(payload, review_response=review_response)
-            print(f"✅ Successfully processed PR #{payload.number}")
-        except Exception as e:
-            print(f"Error processing pull request: {e}")
-            return Response({"error": "Failed to process pull request"}, status=500)
-    # New commit pushed to existing PR
-    elif event == "pull_request" and request.data.get("action") == "synchronize":
-        try:
-            print(f"🔍 Fetching diff content for PR #{payload.number}")
-            diff_text = get_pr_latest_commit_diff(payload)
-            print(f"📄 Retrieved diff content ({len(diff_text)} characters)")
-
-            # ai-review
-            print(f"🤖 Running AI review on diff...")
-            review_response = review_pr(diff=diff_text)
-            print(
-                f"📝 AI review completed with {len(review_response.issues) if review_response.issues else 0} issues found"
-            )
-
-            post_pr_comments(payload, review_response=review_response)
-            print(f"✅ Successfully processed PR #{payload.number}")
-        except Exception as e:
-            print(f"Failed to parse webhook payload: {e}")
-            print(
-                f"Request data keys: {list(request.data.keys()) if hasattr(request, 'data') else 'No data'}"
-            )
-            return Response({"error": "Invalid payload structure"}, status=400)
-
-        if not payload.pull_request.state == "open":
-            print(f"PR #{payload.number} is not open, skipping processing")
-            return Response({"msg": "PR not open, skipping"}, status=200)
 
-        # Fetch diff
-        try:
-            print(f"🔍 Fetching diff content for PR #{payload.number}")
-            diff_text = get_pr_latest_commit_diff(payload)
-            print(f"📄 Retrieved diff content ({len(diff_text)} characters)")
-
-            # ai
-            print(f"🤖 Running AI review on diff...")
-            review_response = review_pr(diff=diff_text)
-            print(
-                f"📝 AI review completed with {len(review_response.issues) if review_response.issues else 0} issues found"
-            )
-
-            post_pr_comments(payload, review_response=review_response)
-            print(f"✅ Successfully processed PR #{payload.number}")
-        except Exception as e:
-            print(f"Error processing pull request: {e}")
-            return Response({"error": "Failed to process pull request"}, status=500)
-    return Response("", status=204)
+def _count_delivery(request, event: str, status: int) -> None:
+    """
+    Count a delivery. Labels come from unauthenticated headers, so events
+    and actions that are never reviewed are folded into "other".
+    """
+    action = ""
+    if event in ACCEPTED_EVENTS:
+        # The body was already read by the handler
+        action = peek_action(request.body) or ""
+        if (event, action) not in ACCEPTED_DELIVERIES:
+            action = "other"
+    elif event != "ping":
+        event = "other"
+    metrics.WEBHOOK_DELIVERIES.labels(event, action, str(status)).inc()
 
 
-def post_pr_comments(payload: GithubPRChanged, review_response: PRReviewResponse):
-    if not review_response.issues:
-        print("No issues found in the diff, skipping comment posting")
-        return
+async def _handle_webhook(request, event: str, delivery: str, span):
 
-    if not payload or not payload.pull_request:
-        print("Invalid payload data, cannot post comments")
-        return
+    # Fast reject: nothing below decodes the JSON body
+    if event == "ping":
+        return JsonResponse({"msg": "pong"}, status=200)
+    if event not in ACCEPTED_EVENTS:
+        return HttpResponse(status=204)
+
+    body = request.body
+    action = peek_action(body)
+    span.set_attributes(action=action or "", body_bytes=len(body))
+    # An unreadable prefix falls through to the full parse below
+    if action is not None and (event, action) not in ACCEPTED_DELIVERIES:
+        return HttpResponse(status=204)
+
+    if not verify_signature(body, request.headers.get("X-Hub-Signature-256")):
+        print(f"❌ Invalid signature for delivery={delivery}")
+        return JsonResponse({"error": "Invalid signature"}, status=401)
+    if settings.WEBHOOK_RECORD_FILE:
+        # A file append; it does not need Django's shared sync thread
+        await sync_to_async(record_delivery, thread_sensitive=False)(
+            event, delivery, body
+        )
 
+    print(f"Received event={event} action={action} delivery={delivery}")
     try:
-        # Step 1: Generate JWT
-        jwt_token = generate_jwt()
+        # Validate only the fields the pipeline uses, straight from the raw
+        # body; DRF's JSON parser would build the whole payload first.
+        payload = PullRequestEvent.model_validate_json(body)
+    except Exception as e:
+        print(f"Failed to parse webhook payload: {e}")
+        return JsonResponse({"error": "Invalid payload structure"}, status=400)
+
+    # PR opened for the first time or new commits pushed to an existing PR
+    if (event, payload.action) not in ACCEPTED_DELIVERIES:
+        return HttpResponse(status=204)
+    print(
+        f"✅ Successfully parsed webhook payload for PR #{payload.number}: {payload.pull_request.title}"
+    )
 
-        # Step 2: Exchange for installation token
-        installation_id = payload.installation.id
-        installation_token = get_installation_token(jwt_token, installation_id)
+    if not payload.pull_request.state == "open":
+        print(f"PR #{payload.number} is not open, skipping processing")
+        return JsonResponse({"msg": "PR not open, skipping"}, status=200)
 
-        # Step 3: Get the diff to understand line positions
-        diff_info = _get_diff_line_mapping(payload)
+    span.set_attribute("pr", payload.number)
+    try:
+        job, created = await sync_to_async(enqueue_review)(event, delivery, payload)
+    except OperationalError as e:
+        # e.g. the database is locked or unreachable; GitHub can redeliver
+        print(f"❌ Could not queue delivery={delivery}: {e}")
+        response = JsonResponse({"error": "Try again later"}, status=503)
+        response["Retry-After"] = "5"
+        return response
+    span.set_attributes(job_id=job.pk, duplicate=not created)
+    if not created:
         print(
-            f"🔍 Parsed diff info for {len(diff_info)} files: {list(diff_info.keys())}"
-        )
-
-        # Debug: Print some line mappings
-        for file_path, line_map in diff_info.items():
-            if line_map:
-                print(
-                    f"📊 {file_path}: lines {min(line_map.keys())}-{max(line_map.keys())} available"
-                )
-            else:
-                print(f"📊 {file_path}: no lines found in diff")
-
-        # GitHub API endpoint
-        url = GITHUB_COMMIT_INLINE_COMMENT_URL_TEMPLATE.format(
-            owner=payload.repository.owner.login,
-            repo=payload.repository.name,
-            pull_number=payload.pull_request.number,
+            f"♻️ Delivery {delivery} for PR #{payload.number} is covered by job {job.pk} ({job.status})"
         )
+        return JsonResponse({"job_id": job.pk, "duplicate": True}, status=200)
+    print(f"📥 Queued review job {job.pk} for PR #{payload.number}")
+    return JsonResponse({"job_id": job.pk}, status=202)
 
-        print(f"Calling PR Comment URL: {url}")
-
-        headers = {
-            "Authorization": f"Bearer {installation_token}",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28",
-        }
-
-        successful_comments = 0
-        for issue in review_response.issues:
-            emoji = {"error": "🚫", "warning": "⚠️", "suggestion": "💡"}.get(
-                issue.type, "ℹ️"
-            )
-            comment_body = f"{emoji} **{issue.type.title()}** ({issue.severity} severity)\\n\\n{issue.message}"
-
-            # Parse the line number from the issue
-            try:
-                line_num = (
-                    int(issue.line.split("-")[0])
-                    if "-" in issue.line
-                    else int(issue.line)
-                )
-            except (ValueError, AttributeError):
-                print(f"⚠️ Invalid line number format: {issue.line}, skipping comment")
-                continue
-
-            # Check if this file and line exist in the diff
-            file_path = issue.file
-            diff_position = _get_diff_position(diff_info, file_path, line_num)
-
-            if diff_position is None:
-                print(
-                    f"⚠️ Line {line_num} in file {file_path} not found in diff, posting as general PR comment"
-                )
-                # Fall back to posting as a general PR comment (issue comment)
-                success = _post_general_pr_comment(
-                    payload, installation_token, comment_body, file_path, line_num
-                )
-                if success:
-                    successful_comments += 1
-                continue
 
-            # Use both position and line parameters for compatibility
-            api_payload = {
-                "body": comment_body,
-                "commit_id": payload.pull_request.head.sha,
-                "path": file_path,
-                "position": diff_position,
-                "line": line_num,
-                "side": "RIGHT",
-            }
+class ReviewQueueCollector:
+    """Queue depth and age, read from the database at scrape time"""
 
-            print(
-                f"📝 Posting PR comment to {file_path}:{line_num} (diff position: {diff_position})"
+    def collect(self):
+        counts = dict.fromkeys([ReviewJob.STATUS_PENDING, ReviewJob.STATUS_RUNNING], 0)
+        try:
+            rows = list(
+                ReviewJob.objects.filter(status__in=counts)
+                .values("status")
+                .annotate(count=Count("id"))
             )
-            response = requests.post(url, json=api_payload, headers=headers)
-            if response.status_code == 201:
-                print(f"✅ Posted comment for {file_path}:{line_num}")
-                successful_comments += 1
-            else:
-                print(f"❌ Failed ({response.status_code}): {response.text}")
-                # Try fallback to general PR comment
-                print(
-                    f"🔄 Trying fallback to general PR comment for {file_path}:{line_num}"
-                )
-                success = _post_general_pr_comment(
-                    payload, installation_token, comment_body, file_path, line_num
-                )
-                if success:
-                    successful_comments += 1
-
-        print(
-            f"🎯 Posted {successful_comments}/{len(review_response.issues)} comments successfully"
+            oldest = ReviewJob.objects.filter(
+                status=ReviewJob.STATUS_PENDING, available_at__lte=timezone.now()
+            ).aggregate(oldest=Min("available_at"))["oldest"]
+        except DatabaseError as e:
+            # The process metrics are still worth serving
+            print(f"⚠️ Could not read the review queue for metrics: {e}")
+            return
+
+        jobs = metrics.GaugeMetricFamily(
+            "testergpt_review_jobs",
+            "Pending and running review jobs",
+            labels=["status"],
         )
-
-    except Exception as e:
-        print(f"Error posting PR comments: {e}")
-        raise
-
-
-def _get_diff_line_mapping(payload: GithubPRChanged) -> Dict[str, Dict[int, int]]:
-    """
-    Get mapping of file line numbers to diff positions.
-    Returns: {file_path: {line_number: diff_position}}
-    """
-    try:
-        diff_url = payload.pull_request.diff_url
-        response = requests.get(diff_url)
-        response.raise_for_status()
-
-        patch = PatchSet(response.text)
-        line_mapping = {}
-
-        for patched_file in patch:
-            file_path = patched_file.path
-            if file_path.startswith("b/"):
-                file_path = file_path[2:]  # Remove 'b/' prefix
-
-            line_mapping[file_path] = {}
-            position = 0
-
-            for hunk in patched_file:
-                for line in hunk:
-                    position += 1
-                    # Only map lines that are additions or context (not deletions)
-                    if line.line_type in ["+", " "]:
-                        if line.target_line_no:
-                            line_mapping[file_path][line.target_line_no] = position
-
-        return line_mapping
-    except Exception as e:
-        print(f"Error parsing diff for line mapping: {e}")
-        return {}
-
-
-def _get_diff_position(
-    diff_info: Dict[str, Dict[int, int]], file_path: str, line_num: int
-) -> Optional[int]:
-    """
-    Get the diff position for a specific file and line number.
-    Returns None if the line doesn't exist in the diff.
-    """
-    # Try exact file path match first
-    if file_path in diff_info:
-        return diff_info[file_path].get(line_num)
-
-    # Try matching without leading path components (in case of path differences)
-    for diff_file_path, line_map in diff_info.items():
-        if diff_file_path.endswith(file_path) or file_path.endswith(diff_file_path):
-            return line_map.get(line_num)
-
-    return None
-
-
-def _post_general_pr_comment(
-    payload: GithubPRChanged,
-    installation_token: str,
-    comment_body: str,
-    file_path: str,
-    line_num: int,
-) -> bool:
-    """
-    Post a general comment on the PR (issue comment) as fallback when review comments fail.
-    """
-    try:
-        # URL for general PR comments (issue comments)
-        url = f"https://api.github.com/repos/{payload.repository.owner.login}/{payload.repository.name}/issues/{payload.pull_request.number}/comments"
-
-        headers = {
-            "Authorization": f"Bearer {installation_token}",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28",
-        }
-
-        # Include file and line info in the comment body
-        enhanced_body = (
-            f"**File: `{file_path}` (around line {line_num})**\\n\\n{comment_body}"
+        for row in rows:
+            counts[row["status"]] = row["count"]
+        for status, count in counts.items():
+            jobs.add_metric([status], count)
+        yield jobs
+        yield metrics.GaugeMetricFamily(
+            "testergpt_review_queue_oldest_seconds",
+            "Age of the oldest review job that is ready to run",
+            value=(timezone.now() - oldest).total_seconds() if oldest else 0,
         )
 
-        api_payload = {"body": enhanced_body}
 
-        print(f"📝 Posting general PR comment for {file_path}:{line_num}")
-        response = requests.post(url, json=api_payload, headers=headers)
+_queue_registry = metrics.CollectorRegistry()
+_queue_registry.register(ReviewQueueCollector())
 
-        if response.status_code == 201:
-            print(f"✅ Posted general comment for {file_path}:{line_num}")
-            return True
-        else:
-            print(
-                f"❌ Failed to post general comment ({response.status_code}): {response.text}"
-            )
-            return False
 
-    except Exception as e:
-        print(f"❌ Error posting general PR comment: {e}")
-        return False
+@require_GET
+def prometheus_metrics(request):
+    """Prometheus text exposition of every process's metrics"""
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+            return HttpResponse(status=401)
+    return HttpResponse(
+        metrics.exposition(_queue_registry), content_type=metrics.CONTENT_TYPE_LATEST
+    )
@@ -45,6 +45,102 @@ class Settings(BaseSettings):
     GPT_API_KEY: str = "sk-YourAIKeyHere"
     GITHUB_APP_ID: int = 0
     GITHUB_PRIVATE_KEY: str = ""
+    GITHUB_TOKEN_REFRESH_MARGIN: int = 300
+    # Login of the app's bot user, e.g. "testergpt[bot]"; any Bot user if empty
+    GITHUB_BOT_LOGIN: str = ""
+
+    # GitHub API client
+    GITHUB_API_URL: str = "https://api.github.com"
+    GITHUB_POOL_SIZE: int = 10
+    GITHUB_CONNECT_TIMEOUT: float = 3.05
+    GITHUB_READ_TIMEOUT: float = 30.0
+    GITHUB_MAX_RETRIES: int = 3
+    # Connections of the async client, shared by every in-flight review
+    GITHUB_ASYNC_POOL_SIZE: int = 100
+    # Rate limit scheduler: seconds between content-creating calls, primary
+    # budget kept for reads, longest wait before sending anyway, and retries
+    # after a 403/429 rate limit response
+    GITHUB_WRITE_INTERVAL: float = 1.0
+    GITHUB_RATE_LIMIT_RESERVE: int = 50
+    GITHUB_RATE_LIMIT_MAX_WAIT: float = 60.0
+    GITHUB_RATE_LIMIT_RETRIES: int = 3
+
+    # Number of parsed diffs kept in memory per process
+    DIFF_CACHE_SIZE: int = 32
+
+    # LLM review
+    LLM_MODEL: str = "gemini-2.5-pro"
+    LLM_TEMPERATURE: float = 0.2
+    # Gemini endpoint override, e.g. a proxy or a local stub; uses the REST
+    # transport, which async reviews reach through a worker thread
+    LLM_API_ENDPOINT: str = ""
+
+    # Model router: small or low-risk chunks go to the fast model
+    LLM_FAST_MODEL: str = "gemini-2.5-flash"
+    LLM_ROUTER_FAST_MAX_TOKENS: int = 2000
+    LLM_ROUTER_FAST_MAX_FILES: int = 3
+    LLM_ROUTER_LOW_RISK_EXTENSIONS: list[str] = [
+        ".md",
+        ".rst",
+        ".txt",
+        ".json",
+        ".yml",
+        ".yaml",
+        ".toml",
+        ".lock",
+        ".csv",
+        ".svg",
+    ]
+    LLM_CHUNK_TOKEN_BUDGET: int = 24000
+    LLM_REVIEW_CONCURRENCY: int = 4
+
+    # LLM gateway: AIMD concurrency bounds, tokens per minute (0 = unlimited),
+    # retries of throttled/transient failures and the latency-per-token
+    # multiple of the baseline that counts as overload
+    LLM_INITIAL_CONCURRENCY: int = 4
+    LLM_MIN_CONCURRENCY: int = 1
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_TOKENS_PER_MINUTE: int = 0
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_DELAY: float = 2.0
+    LLM_LATENCY_TOLERANCE: float = 2.0
+
+    # Per-hunk review cache; set REVIEW_CACHE_DB (relative to BASE_DIR) to persist it
+    REVIEW_CACHE_SIZE: int = 4096
+    REVIEW_CACHE_DB: str = ""
+
+    # Streaming review: findings are posted in batches while the model runs
+    LLM_STREAMING: bool = False
+    REVIEW_POST_BATCH_SIZE: int = 10
+    REVIEW_POST_BATCH_SECONDS: float = 5.0
+
+    # Background review worker
+    REVIEW_WORKER_CONCURRENCY: int = 4
+    REVIEW_WORKER_POLL_INTERVAL: float = 1.0
+    REVIEW_JOB_MAX_ATTEMPTS: int = 3
+    REVIEW_JOB_RETRY_DELAY: int = 30
+    REVIEW_JOB_LEASE_SECONDS: int = 900
+    # Window in which redeliveries and repeated head SHAs are not reviewed again
+    REVIEW_IDEMPOTENCY_TTL: int = 24 * 60 * 60
+    # Synchronize reviews wait this long for further pushes to the same PR
+    REVIEW_SYNC_DEBOUNCE_SECONDS: int = 30
+    # Append every authenticated pull_request delivery to this JSON Lines
+    # file (relative to BASE_DIR) for ``manage.py loadbench --deliveries``
+    WEBHOOK_RECORD_FILE: str = ""
+
+    # Tracing: "" (off), "jsonl" to append spans to TRACING_JSONL_FILE
+    # (relative to BASE_DIR) or "otlp" to post them to an OTLP/HTTP collector
+    TRACING_EXPORTER: str = ""
+    TRACING_JSONL_FILE: str = "traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_SERVICE_NAME: str = "testergpt"
+    TRACING_FLUSH_SECONDS: float = 2.0
+
+    # Metrics: with a directory set, every process writes its metrics there
+    # and /metrics aggregates them. Empty it before starting the processes.
+    PROMETHEUS_MULTIPROC_DIR: str = ""
+    # Bearer token required to scrape /metrics; empty leaves it open
+    METRICS_TOKEN: str = ""
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -150,6 +246,13 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts, so concurrent
+            # deliveries queue on the busy timeout instead of failing with
+            # "database is locked" when a read lock cannot be upgraded.
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
     }
 }
 
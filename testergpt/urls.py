@@ -18,10 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from github.views import prometheus_metrics
 from testergpt.views import health_check
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("healthz/", health_check, name="health_check"),
+    path("metrics", prometheus_metrics, name="metrics"),
     path("github/", include("github.urls"), name="github_integration"),
 ]